@@ -0,0 +1,462 @@
+"""
+Local stand-in for the parts of GitHub the workflow deployer talks to, used by
+benchmarks/fleet.py:
+
+- generate_fleet() writes bare git repositories (the participating repos, a
+  managed-ci-workflow repo with tags and devx-sonarqube) under <root>/git/<org>/
+- serve() answers the REST and GraphQL calls of requirement/module.py and the
+  utils/ layers from those repositories: repository listing and metadata,
+  contents, Git Data API (blobs/trees/commits/refs), branch protection, org
+  secrets, repository variables, and the repository(owner:, name:) GraphQL
+  selections (aliased or not).  Every request is counted per endpoint together
+  with the bytes received and sent, see GET /_stats.
+
+The GraphQL support is deliberately naive: every repository(owner:, name:)
+selection of a query is answered with all the fields the deployer selects and
+mutations just succeed.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(f'{os.path.dirname(os.path.abspath(__file__))}/..')
+from utils.github_client import GitHubClient
+
+epoch = 1700000000
+author = f'Fleet Bench <bench@example.com> {epoch} +0000'
+managed_ci_workflow_repo = 'managed-ci-workflow'
+sonarqube_repo = 'devx-sonarqube'
+refspecs = ['v1.0.0', 'v1.1.0']
+
+
+def workflow(name: str, branches=('main',), cron=None, revision=0) -> str:
+    schedule = f"  schedule:\n    - cron: '{cron}'\n" if cron else ''
+    branch_list = ''.join(f'      - {branch}\n' for branch in branches)
+    return (f'name: {name}\n'
+            f'on:\n'
+            f'  push:\n'
+            f'    branches:\n{branch_list}'
+            f'  pull_request:\n'
+            f'    branches:\n{branch_list}'
+            f'{schedule}'
+            f'jobs:\n'
+            f'  build:\n'
+            f'    runs-on: ubuntu-latest\n'
+            f'    steps:\n'
+            f'      - uses: actions/checkout@v4\n'
+            f'      - run: echo "{name} revision {revision}"\n')
+
+
+def managed_ci_files(revision: int) -> Dict[str, str]:
+    files = {
+        'workflow-manifest.yaml': (
+            'primary_workflows:\n  - managed-ci-pr.yaml\n  - managed-ci-push.yaml\n'
+            'optional_workflows:\n  - managed-ci-nightly.yaml\n'
+            'template_workflows:\n  - managed-ci-template.yaml\n'
+            'custom_branch_workflows:\n  - managed-ci-push.yaml\n'
+            'cron_workflows:\n  - managed-ci-nightly.yaml\n'),
+        'workflows/managed-ci-pr.yaml': workflow('managed-ci-pr', revision=revision),
+        'workflows/managed-ci-push.yaml': workflow('managed-ci-push'),
+        'workflows/managed-ci-nightly.yaml': workflow('managed-ci-nightly', cron='0 3 * * *'),
+        'templates/managed-ci-template.yaml': workflow('managed-ci-template'),
+    }
+    return files
+
+
+def fast_import_commit(ref: str, files: Dict[str, str], mark: int, parent=None, message='bench') -> str:
+    stream = [f'commit {ref}', f'mark :{mark}', f'author {author}', f'committer {author}',
+              f'data {len(message.encode())}', message]
+    if parent:
+        stream.append(f'from :{parent}')
+    for path, content in files.items():
+        data = content.encode()
+        stream += [f'M 100644 inline {path}', f'data {len(data)}', content]
+    return '\n'.join(stream) + '\n'
+
+
+def create_repo(path: str, stream: str, default_branch: str):
+    subprocess.run(['git', 'init', '--quiet', '--bare', f'--initial-branch={default_branch}', path], check=True)
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=path, input=stream.encode(), check=True)
+
+
+def target_repo_files(index: int, refspec: str, default_branch: str) -> Dict[str, str]:
+    """
+    The participating repos cycle through four states:
+      0 - no workflows at all
+      1 - in sync with the managed workflows of the refspec (plus a workflow of its own)
+      2 - outdated managed workflows and a stale managed-ci workflow to delete
+      3 - the managed workflows of the other refspec
+    """
+    files = {'README.md': f'# bench-repo-{index}\n'}
+    profile = index % 4
+    if profile == 0:
+        return files
+    revision = refspecs.index(refspec)
+    if profile == 3:
+        revision = 1 - revision
+    managed = managed_ci_files(revision)
+    for path, content in managed.items():
+        if path.startswith('workflows/') or path.startswith('templates/'):
+            name = os.path.basename(path)
+            if name == 'managed-ci-nightly.yaml':
+                continue
+            if name == 'managed-ci-push.yaml' and default_branch != 'main':
+                content = workflow('managed-ci-push', branches=('main', default_branch))
+            files[f'.github/workflows/{name}'] = content
+    if profile == 1:
+        files['.github/workflows/ci.yaml'] = workflow('ci')
+    if profile == 2:
+        files['.github/workflows/managed-ci-pr.yaml'] = workflow('managed-ci-pr', revision=-1)
+        files['.github/workflows/managed-ci-legacy.yaml'] = workflow('managed-ci-legacy')
+    return files
+
+
+# protection of the default branches of a generated fleet, as PUT by the deployer
+protection_rule = {
+    'required_status_checks': {'strict': False, 'contexts': ['build', 'managed-ci-pr']},
+    'enforce_admins': True,
+    'required_pull_request_reviews': {'dismiss_stale_reviews': True, 'require_code_owner_reviews': False,
+                                      'required_approving_review_count': 1},
+    'restrictions': None,
+    'required_linear_history': False,
+}
+
+
+def protection_json(rule: Dict) -> Dict:
+    """GET /branches/<branch>/protection for a rule as PUT: the boolean settings are {'enabled': ...} objects."""
+    protection = {'required_status_checks': {'strict': False, **(rule.get('required_status_checks') or {})}}
+    for setting in ('enforce_admins', 'required_linear_history', 'allow_force_pushes', 'allow_deletions'):
+        protection[setting] = {'enabled': bool(rule.get(setting))}
+    if rule.get('required_pull_request_reviews'):
+        protection['required_pull_request_reviews'] = rule['required_pull_request_reviews']
+    if rule.get('restrictions'):
+        protection['restrictions'] = rule['restrictions']
+    return protection
+
+
+def generate_fleet(root: str, size: int, org='glcp') -> Dict:
+    """
+    Creates the bare repositories of a fleet of "size" participating repos under
+    <root>/git/<org>/.  Returns the fleet description used by serve() and fleet.py:
+    {'org', 'git_root', 'repositories': {name: {...}}, 'deployment': [module repositories],
+     'protection': [[repo, branch, rule as PUT to /branches/<branch>/protection]]}
+    """
+    git_root = f'{root}/git'
+    org_dir = f'{git_root}/{org}'
+    os.makedirs(org_dir, exist_ok=True)
+    repositories = {}
+
+    stream = fast_import_commit('refs/heads/main', managed_ci_files(0), 1)
+    stream += fast_import_commit('refs/heads/main', managed_ci_files(1), 2, parent=1)
+    stream += f'reset refs/tags/{refspecs[0]}\nfrom :1\n\nreset refs/tags/{refspecs[1]}\nfrom :2\n'
+    create_repo(f'{org_dir}/{managed_ci_workflow_repo}.git', stream, 'main')
+    stream = fast_import_commit('refs/heads/main', {'sonarqube-management/sonar_data/sonar.yaml': 'Projects: []\n'}, 1)
+    create_repo(f'{org_dir}/{sonarqube_repo}.git', stream, 'main')
+
+    deployment, protection = [], []
+    for index in range(size):
+        name = f'bench-repo-{index:05d}'
+        refspec = refspecs[index % len(refspecs)]
+        default_branch = 'develop' if index % 5 == 4 else 'main'
+        stream = fast_import_commit(f'refs/heads/{default_branch}', target_repo_files(index, refspec, default_branch), 1)
+        create_repo(f'{org_dir}/{name}.git', stream, default_branch)
+        repositories[name] = {'archived': index % 50 == 49, 'default_branch': default_branch,
+                              'variables': {'LANGUAGE': 'python'} if index % 2 == 0 else {}}
+        # the default branches are protected, so the deployer updates (GET + PUT) their rules
+        protection.append([name, default_branch, protection_rule])
+        repo = {'name': name, 'refspec': refspec}
+        if index % 3 == 0:
+            repo['optional_workflows'] = ['managed-ci-nightly.yaml']
+        deployment.append(repo)
+    for name in (managed_ci_workflow_repo, sonarqube_repo):
+        repositories[name] = {'archived': False, 'default_branch': 'main', 'variables': {}}
+    for repo_id, (name, repo) in enumerate(sorted(repositories.items()), start=1000):
+        repo.update({'id': repo_id, 'node_id': f'R_bench{repo_id}', 'path': f'{org_dir}/{name}.git'})
+    return {'org': org, 'git_root': git_root, 'repositories': repositories, 'deployment': deployment,
+            'protection': protection}
+
+
+class FakeGitHub:
+    """The state behind the fake API: the fleet's bare repos plus protection rules, secrets and stats."""
+
+    def __init__(self, fleet: Dict, latency=0.0):
+        self.org = fleet['org']
+        self.repositories = fleet['repositories']
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.protection: Dict[tuple, Dict] = {(repo, branch): rule for repo, branch, rule in fleet.get('protection', [])}
+        self.secrets: Dict[str, set] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def git(self, repo: str, *args, input=None) -> str:
+        proc = subprocess.run(['git', *args], cwd=self.repositories[repo]['path'], input=input,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if proc.returncode:
+            raise LookupError(proc.stderr.decode().strip())
+        return proc.stdout.decode()
+
+    def record(self, endpoint: str, received: int, sent: int, status: int):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {'count': 0, 'received': 0, 'sent': 0, 'not_modified': 0})
+            stats['count'] += 1
+            stats['received'] += received
+            stats['sent'] += sent
+            stats['not_modified'] += int(status == 304)
+
+    def repo_json(self, name: str) -> Dict:
+        repo = self.repositories[name]
+        return {'id': repo['id'], 'node_id': repo['node_id'], 'name': name, 'full_name': f'{self.org}/{name}',
+                'default_branch': repo['default_branch'], 'archived': repo['archived'],
+                'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))}
+
+    def head(self, name: str) -> str:
+        return self.git(name, 'rev-parse', f'refs/heads/{self.repositories[name]["default_branch"]}').strip()
+
+    def tree_entries(self, name: str, treeish: str) -> List[Dict]:
+        entries = []
+        for line in self.git(name, 'ls-tree', '-l', treeish).splitlines():
+            meta, path = line.split('\t', 1)
+            mode, kind, sha, size = meta.split()
+            entries.append({'name': os.path.basename(path), 'type': kind, 'sha': sha,
+                            'size': int(size) if size != '-' else 0})
+        return entries
+
+    def rules(self, name: str) -> List[Dict]:
+        with self.lock:
+            return [{'id': f'BPR_{self.repositories[name]["id"]}_{branch}', 'pattern': branch,
+                     'requiredStatusCheckContexts': rule.get('required_status_checks', {}).get('contexts', [])}
+                    for (repo, branch), rule in self.protection.items() if repo == name]
+
+    def graphql_repository(self, name: str) -> Dict:
+        repo = self.repositories[name]
+        head = self.head(name)
+        try:
+            workflows_oid = self.git(name, 'rev-parse', f'{head}:.github/workflows').strip()
+            entries = [{'name': e['name'], 'type': e['type'], 'oid': e['sha'], 'object': {'byteSize': e['size']}}
+                       for e in self.tree_entries(name, workflows_oid)]
+            workflows = {'oid': workflows_oid, 'entries': entries}
+        except LookupError:
+            workflows = None
+        rules = self.rules(name)
+        return {'id': repo['node_id'], 'isArchived': repo['archived'],
+                'defaultBranchRef': {'name': repo['default_branch'], 'target': {'oid': head}},
+                'workflows': workflows,
+                'branchProtectionRules': {'pageInfo': {'hasNextPage': False, 'endCursor': None}, 'nodes': rules}}
+
+    def graphql(self, body: Dict):
+        query = body.get('query', '')
+        if query.lstrip().startswith('mutation'):
+            return 200, {'data': {}}
+        data, errors = {}, []
+        for alias, owner, name in re.findall(r'(?:(\w+)\s*:\s*)?repository\(\s*owner:\s*"([^"]+)",\s*name:\s*"([^"]+)"', query):
+            key = alias or 'repository'
+            if owner != self.org or name not in self.repositories:
+                data[key] = None
+                errors.append({'type': 'NOT_FOUND', 'path': [key],
+                               'message': f"Could not resolve to a Repository with the name '{owner}/{name}'."})
+                continue
+            data[key] = self.graphql_repository(name)
+        return 200, {'data': data, **({'errors': errors} if errors else {})}
+
+    def rest(self, method: str, path: str, params: Dict[str, str], body):
+        org_repos = re.fullmatch(rf'/orgs/{self.org}/repos', path)
+        if org_repos and method == 'GET':
+            per_page, page = int(params.get('per_page', 30)), int(params.get('page', 1))
+            names = sorted(self.repositories)
+            chunk = [self.repo_json(name) for name in names[(page - 1) * per_page:page * per_page]]
+            next_page = page + 1 if page * per_page < len(names) else None
+            return 200, chunk, next_page
+        secret = re.fullmatch(rf'/orgs/{self.org}/actions/secrets/([^/]+)/repositories', path)
+        if secret:
+            with self.lock:
+                selected = self.secrets.setdefault(secret.group(1), set())
+                if method == 'PUT':
+                    selected.clear()
+                    selected.update(body['selected_repository_ids'])
+                    return 204, None, None
+                repos = [self.repo_json(name) for name, repo in sorted(self.repositories.items()) if repo['id'] in selected]
+            per_page, page = int(params.get('per_page', 30)), int(params.get('page', 1))
+            return 200, {'total_count': len(repos), 'repositories': repos[(page - 1) * per_page:page * per_page]}, None
+
+        m = re.fullmatch(r'/repos/([^/]+)/([^/]+)(/.*)?', path)
+        if not m or m.group(1) != self.org or m.group(2) not in self.repositories:
+            return 404, {'message': 'Not Found'}, None
+        name, rest = m.group(2), m.group(3) or ''
+        if rest == '' and method == 'GET':
+            return 200, self.repo_json(name), None
+        variable = re.fullmatch(r'/actions/variables/([^/]+)', rest)
+        if variable and method == 'GET':
+            if variable.group(1) not in self.repositories[name]['variables']:
+                return 404, {'message': 'Not Found'}, None
+            return 200, {'name': variable.group(1), 'value': self.repositories[name]['variables'][variable.group(1)]}, None
+        protection = re.fullmatch(r'/branches/(.+)/protection', rest)
+        if protection:
+            key = (name, protection.group(1))
+            with self.lock:
+                if method == 'PUT':
+                    self.protection[key] = body
+                    return 200, body, None
+                if key not in self.protection:
+                    return 404, {'message': 'Branch not protected'}, None
+                rule = self.protection[key]
+            return 200, protection_json(rule), None
+        contents = re.fullmatch(r'/contents/(.*)', rest)
+        if contents and method == 'GET':
+            ref = params.get('ref') or self.head(name)
+            try:
+                kind = self.git(name, 'cat-file', '-t', f'{ref}:{contents.group(1)}').strip()
+            except LookupError:
+                return 404, {'message': 'Not Found'}, None
+            if kind == 'tree':
+                return 200, [{**e, 'type': 'file' if e['type'] == 'blob' else 'dir',
+                              'path': f'{contents.group(1)}/{e["name"]}'}
+                             for e in self.tree_entries(name, f'{ref}:{contents.group(1)}')], None
+            content = self.git(name, 'cat-file', 'blob', f'{ref}:{contents.group(1)}')
+            sha = self.git(name, 'rev-parse', f'{ref}:{contents.group(1)}').strip()
+            return 200, {'name': os.path.basename(contents.group(1)), 'path': contents.group(1), 'type': 'file',
+                         'sha': sha, 'size': len(content.encode()), 'encoding': 'base64',
+                         'content': base64.b64encode(content.encode()).decode()}, None
+        return self.git_data(method, name, rest, body)
+
+    def git_data(self, method: str, name: str, rest: str, body):
+        ref = re.fullmatch(r'/git/refs?/heads/(.+)', rest)
+        if ref and method == 'GET':
+            try:
+                return 200, {'ref': f'refs/heads/{ref.group(1)}',
+                             'object': {'sha': self.git(name, 'rev-parse', f'refs/heads/{ref.group(1)}').strip()}}, None
+            except LookupError:
+                return 404, {'message': 'Not Found'}, None
+        if ref and method == 'PATCH':
+            self.git(name, 'update-ref', f'refs/heads/{ref.group(1)}', body['sha'])
+            return 200, {'ref': f'refs/heads/{ref.group(1)}', 'object': {'sha': body['sha']}}, None
+        blob = re.fullmatch(r'/git/blobs(?:/([0-9a-f]+))?', rest)
+        if blob and method == 'GET':
+            content = self.git(name, 'cat-file', 'blob', blob.group(1))
+            return 200, {'sha': blob.group(1), 'encoding': 'base64',
+                         'content': base64.b64encode(content.encode()).decode()}, None
+        if blob and method == 'POST':
+            content = base64.b64decode(body['content']) if body.get('encoding') == 'base64' else body['content'].encode()
+            return 201, {'sha': self.git(name, 'hash-object', '-w', '--stdin', input=content).strip()}, None
+        commit = re.fullmatch(r'/git/commits(?:/([0-9a-f]+))?', rest)
+        if commit and method == 'GET':
+            return 200, {'sha': commit.group(1), 'tree': {'sha': self.git(name, 'rev-parse', f'{commit.group(1)}^{{tree}}').strip()}}, None
+        if commit and method == 'POST':
+            args = ['commit-tree', body['tree'], '-m', body['message']]
+            for parent in body.get('parents', []):
+                args += ['-p', parent]
+            env_sha = self.git_env(name, *args)
+            return 201, {'sha': env_sha}, None
+        if rest == '/git/trees' and method == 'POST':
+            return 201, {'sha': self.write_tree(name, body.get('base_tree'), body['tree'])}, None
+        return 404, {'message': 'Not Found'}, None
+
+    def git_env(self, name: str, *args) -> str:
+        env = dict(os.environ, GIT_AUTHOR_NAME='Fleet Bench', GIT_AUTHOR_EMAIL='bench@example.com',
+                   GIT_COMMITTER_NAME='Fleet Bench', GIT_COMMITTER_EMAIL='bench@example.com')
+        proc = subprocess.run(['git', *args], cwd=self.repositories[name]['path'], env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return proc.stdout.decode().strip()
+
+    def write_tree(self, name: str, base_tree, entries: List[Dict]) -> str:
+        index = f'{self.repositories[name]["path"]}/bench-index-{threading.get_ident()}'
+        env = dict(os.environ, GIT_INDEX_FILE=index)
+        cwd = self.repositories[name]['path']
+        try:
+            if base_tree:
+                subprocess.run(['git', 'read-tree', base_tree], cwd=cwd, env=env, check=True)
+            # mode 0 removes the path from the index
+            info = ''.join(f'{entry["mode"] if entry.get("sha") else 0} {entry.get("sha") or "0" * 40}\t{entry["path"]}\n'
+                           for entry in entries)
+            subprocess.run(['git', 'update-index', '--index-info'], cwd=cwd, env=env, input=info.encode(), check=True)
+            return subprocess.run(['git', 'write-tree'], cwd=cwd, env=env, check=True,
+                                  stdout=subprocess.PIPE).stdout.decode().strip()
+        finally:
+            if os.path.exists(index):
+                os.remove(index)
+
+
+def handler_class(github: FakeGitHub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle_any(self, method):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            if url.path == '/_stats':
+                with github.lock:
+                    return self.reply(200, json.dumps(github.stats).encode(), count=False)
+            if github.latency:
+                time.sleep(github.latency)
+            body = json.loads(raw) if raw else None
+            headers = {}
+            try:
+                if url.path == '/graphql':
+                    status, payload = github.graphql(body or {})
+                else:
+                    status, payload, next_page = github.rest(method, url.path, params, body)
+                    if next_page:
+                        query = dict(params, page=str(next_page))
+                        link = f'http://{self.headers["Host"]}{url.path}?' + '&'.join(f'{k}={v}' for k, v in query.items())
+                        headers['Link'] = f'<{link}>; rel="next"'
+            except LookupError as e:
+                status, payload = 404, {'message': str(e)}
+            except subprocess.CalledProcessError as e:
+                status, payload = 422, {'message': f'{e.cmd} failed'}
+            data = json.dumps(payload).encode() if payload is not None else b''
+            if method == 'GET' and status == 200:
+                etag = f'"{hashlib.md5(data).hexdigest()}"'
+                headers['ETag'] = etag
+                if self.headers.get('If-None-Match') == etag:
+                    status, data = 304, b''
+            self.reply(status, data, headers, received=len(raw),
+                       endpoint=GitHubClient.endpoint(method, url.path))
+
+        def reply(self, status, data, headers=None, received=0, endpoint=None, count=True):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+            if count:
+                github.record(endpoint, received, len(data), status)
+
+        def do_GET(self):
+            self.handle_any('GET')
+
+        def do_POST(self):
+            self.handle_any('POST')
+
+        def do_PUT(self):
+            self.handle_any('PUT')
+
+        def do_PATCH(self):
+            self.handle_any('PATCH')
+
+        def do_DELETE(self):
+            self.handle_any('DELETE')
+
+    return Handler
+
+
+def serve(fleet: Dict, port_queue, latency=0.0):
+    """Serves the fake API for "fleet" on a free local port, which is put on "port_queue"."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class(FakeGitHub(fleet, latency)))
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
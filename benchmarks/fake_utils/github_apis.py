@@ -0,0 +1,31 @@
+"""
+Stand-in for the deployer's utils/github_apis.py (not part of this repository):
+the GitHubAPIs calls requirement/module.py makes, over the REST API through
+utils/github_client.py so that they are counted like the deployer's own calls.
+benchmarks/fleet.py only puts it in the work directory when the real module is
+missing.
+"""
+from utils.github_client import github_http
+
+
+class GitHubAPIs:
+    def __init__(self, org_name, token, logger=None):
+        self.org_name = org_name
+        self.logger = logger
+        self.headers = {'Authorization': f'token {token}', 'Accept': 'application/vnd.github.v3+json'}
+
+    def get_repo(self, repo_name):
+        response = github_http.get(f'https://api.github.com/repos/{self.org_name}/{repo_name}', headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+    def check_is_repo_archived(self, repo_name) -> bool:
+        return self.get_repo(repo_name)['archived']
+
+    def get_default_branch(self, repo_name) -> str:
+        return self.get_repo(repo_name)['default_branch']
+
+    def check_workflow_file(self, repo_name, workflow) -> bool:
+        response = github_http.get(f'https://api.github.com/repos/{self.org_name}/{repo_name}'
+                                   f'/contents/.github/workflows/{workflow}', headers=self.headers)
+        return response.status_code == 200 and response.json().get('size', 0) > 0
@@ -0,0 +1,29 @@
+"""
+Stand-in for the deployer's utils/myutils.py (not part of this repository), with
+the helpers requirement/module.py uses.  benchmarks/fleet.py only puts it in the
+work directory when the real module is missing.
+"""
+import logging
+import os
+
+
+def mkdir_p(path):
+    os.makedirs(path, exist_ok=True)
+
+
+def file_exists(path) -> bool:
+    return os.path.isfile(path)
+
+
+def get_logger(name, filename, level='info', output_to_console=False) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(getattr(logging, level.upper()))
+    if not logger.handlers:
+        mkdir_p(os.path.dirname(filename) or '.')
+        handlers = [logging.FileHandler(filename)]
+        if output_to_console:
+            handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            logger.addHandler(handler)
+    return logger
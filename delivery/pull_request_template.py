@@ -9,6 +9,7 @@ sys.path.append(f'{os.path.dirname(__file__)}/..')
 import utils.myutils as mu
 from datetime import datetime
 from utils.github_apis import GitHubAPIs
+from utils.repo_cache import repo_metadata_cache
 import csv
 import traceback
 from datetime import datetime
@@ -29,37 +30,25 @@ def main(repo_exclude_list,module_description, module_name):
     ## Change values accordingly in get_logger()
     logger = mu.get_logger('pull-request-template', f'{logdir}/pull-request-template.log', level='debug', output_to_console=True)
     gh_obj = GitHubAPIs(org_name='glcp', token=token, logger=logger)
+    repo_cache = repo_metadata_cache('glcp', {'Authorization': f'Bearer {token}'})
     final_repo_list=[]
     print(f'Repo names that are excluded to enforce pull request template\n',repo_exclude_list)
-    counter : int = 1
-    repos : List[str] = gh_obj.get_repo_names_in_org()
-    # repos=['sridhar-py','sd-mdata-service']
-
-    logger.debug(f'Final list of Repos in the glcp org')
-    for i in repos:
-        if i not in repo_exclude_list:
-            # default_branch: str = gh_obj.get_default_branch(i)
-            final_repo_list.append(i)
-            # print(f'{counter}: {i} {default_branch}')
-            print(f'{counter}: {i}')
-            counter+=1
+    repo_exclude_set = set(repo_exclude_list)
 
     # Calculate original pr template md5sum
     original_pr_template_file_path=['files/PULL_REQUEST_TEMPLATE.md']
     original_md5=calc_template_md5sum(gh_obj.get_pr_template_file_content('org-policies',original_pr_template_file_path))
 
-
-    # final_repo_list=['sridhar-py','aws-hpe_onepass_2_dev-config']  # TODO remove
-    counter : int = 1
-    for repos in final_repo_list:
-        print(f'{counter}: {repos}')
-        counter+=1
-
     repos_to_be_updated=[]
     counter : int = 1
     template_file_names=['.github/PULL_REQUEST_TEMPLATE.md','.github/pull_request_template.md']
-    for i in final_repo_list:
-        if gh_obj.check_is_repo_archived(i):
+    # The org repos are streamed page by page: the first repos are processed while the
+    # rest of the listing is still being fetched.
+    for i, repo_metadata in repo_cache.stream():
+        if i in repo_exclude_set:
+            continue
+        final_repo_list.append(i)
+        if repo_metadata['archived']:
             logger.info(f'Repo "{i}" is Archived ...Skipping')
             continue
         logger.debug(f' {counter}: repo {i} is being processed.')
@@ -14,6 +14,7 @@ sys.path.append(f'{os.path.dirname(__file__)}/..')
 import subprocess
 import utils.myutils as mu
 from utils.github_apis import GitHubAPIs
+from utils.repo_cache import repo_metadata_cache
 
 github_token = os.environ['GITHUB_APP_TOKEN']
 organisation = 'glcp'
@@ -48,7 +49,8 @@ def main():
     logger = mu.get_logger('workflow-deployer', f'{logdir}/workflow-deployer.log', level='debug',
                            output_to_console=True)
     gh_obj = GitHubAPIs(org_name=org_name, token=app_token, logger=logger)
-    org_repos: List[str] = gh_obj.get_repo_names_in_org()
+    # membership checks are answered from the (set-backed) repository metadata cache
+    org_repos = repo_metadata_cache(org_name, headers)
 
 
     # for repo in repositories:
@@ -16,6 +16,7 @@ import subprocess
 import utils.myutils as mu
 from utils.myutils import file_exists, mkdir_p
 from utils.github_apis import GitHubAPIs
+from utils.repo_cache import repo_metadata_cache
 from os import listdir
 from os.path import isfile, join
 
@@ -50,7 +51,8 @@ def main(module_name='', module_description='', repositories=[], default_managed
     logger = mu.get_logger('workflow-deployer', f'{logdir}/workflow-deployer.log', level='debug',
                            output_to_console=True)
     gh_obj = GitHubAPIs(org_name=org_name, token=app_token, logger=logger)
-    org_repos: List[str] = gh_obj.get_repo_names_in_org()
+    # membership checks are answered from the (set-backed) repository metadata cache
+    org_repos = repo_metadata_cache(org_name, headers)
 
     logger.debug(f'Final list of Repos in the glcp org')
 
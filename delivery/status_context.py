@@ -5,11 +5,17 @@ import sys
 import yaml
 import os
 
+sys.path.append(f'{os.path.dirname(__file__)}/..')
+from utils.github_client import github_http
+from utils.bpr_reconciler import reconcile_branch_protection
+from utils.repo_snapshot import fetch_repository_snapshots, fetch_branch_protection_rules
+from utils.repo_cache import repo_metadata_cache
+from utils.secret_access import reconcile_secret_access
+
 api_url = 'https://api.github.com/graphql'
 github_token = os.environ['GITHUB_APP_TOKEN']
 organisation = 'glcp'
 repositories = []
-repository_ids = []
 access_to_secrets = ['SECRET1', 'SECRET2']
 
 headers = {
@@ -43,48 +49,28 @@ def main():
         print("Unable to fetch repository names from input file")
 
 def create_list_repo_ids(repositories):
-    """This functions creates list of repository ids where secret access needs to be updated"""
-    auth_header = {'Authorization': 'token '+github_token, 'X-GitHub-Api-Version': '2022-11-28', 'Accept': 'application/vnd.github+json'}
-    repository_ids = []
-    for repo in repositories:
-        githubapi = "https://api.github.com/repos/"+organisation+"/"+repo
-        repo_response = requests.get(githubapi, headers=auth_header)
-        repository_ids.append(repo_response.json()['id'])
-    globals()["repository_ids"] = repository_ids
-    if bool(repository_ids):
-        update_secret_access_to_repo(repository_ids)
-    else:
-        print("Unable to create list of repository ids")
-
-def update_secret_access_to_repo(repository_ids):
-    """This function adds the repositories for to access Organisation secrets"""
+    """This function gives the repositories access to the Organisation secrets, one PUT per changed secret"""
     headers = {
         'Accept': 'application/vnd.github+json',
         'Authorization': f'Bearer {github_token}',
         'X-GitHub-Api-Version': '2022-11-28'
     }
-    for secret in access_to_secrets:
-        url = "https://api.github.com/orgs/"+organisation+"/actions/secrets/"+secret+"/repositories"
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            response_data = json.loads(response.text)
-            existing_repo_ids = [rule ["id"] for rule in response_data["repositories"]]
-            repo_ids = list(set(existing_repo_ids + repository_ids))
-            data = {
-                "selected_repository_ids": repo_ids
-            }
-        except requests.exceptions.RequestException as e:
-            print(f'Error while fetching existing repository names for {secret} secret')
-        try:
-            response = requests.put(url, headers=headers, json=data)
-            response.raise_for_status()
-            print(f'Updated access to the {secret} secret for all given repos')
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to update the secret access for repository. Status code: {response.status_code} {str(e)}")
+    try:
+        reconcile_secret_access(organisation, {secret: repositories for secret in access_to_secrets}, headers)
+    except requests.exceptions.RequestException as e:
+        print(f'Failed to list the repositories of {organisation}: {str(e)}')
 
-def check_repo_exist(repository):
+def check_repo_exist(repository, snapshot=None):
     """ This Function checks if given Github Repo exists """
+    if not snapshot:
+        # id and default branch from the repository metadata cache, the rules are queried
+        cached = repo_metadata_cache(organisation, headers).get(repository)
+        if cached:
+            snapshot = {'id': cached['node_id'], 'default_branch': cached['default_branch'],
+                        'branch_protection_rules': None}
+    if snapshot:
+        # already fetched in bulk by fetch_repository_snapshots()
+        return get_default_branch(snapshot['id'], repository, snapshot=snapshot)
     query = f'''
     query {{
         repository(owner: "{organisation}", name: "{repository}") {{
@@ -93,7 +79,7 @@ def check_repo_exist(repository):
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         repository_id = response.json().get("data", {}).get("repository")['id']
         if repository_id:
@@ -105,8 +91,11 @@ def check_repo_exist(repository):
         print(f"Failed to query GitHub GraphQL API. Status code: {response.status_code} {str(e)}")
         raise ValueError("The repository '{repository}' does not exist.")
 
-def get_default_branch(repository_id, repository):
+def get_default_branch(repository_id, repository, snapshot=None):
     """ This Function gets default branch for given repo """
+    if snapshot:
+        return check_if_branch_protected(repository, repository_id, snapshot['default_branch'],
+                                         rules=snapshot['branch_protection_rules'])
     query = f'''
     query {{
     repository(owner: "{organisation}", name: "{repository}") {{
@@ -122,7 +111,7 @@ def get_default_branch(repository_id, repository):
     }
     
     try:
-        response = requests.post(api_url, headers=headers, json={'query': query, 'variables': variables})
+        response = github_http.post(api_url, headers=headers, json={'query': query, 'variables': variables})
         response.raise_for_status()
         default_branch = response.json()['data']['repository']['defaultBranchRef']['name']
         check_if_branch_protected(repository, repository_id, default_branch)
@@ -130,31 +119,16 @@ def get_default_branch(repository_id, repository):
         print('Failed to retrieve the default branch. Status code:', response.status_code)
         raise ValueError("Failed to retrive default branch for repository {repository} {str(e)}.")
 
-def check_if_branch_protected(repository, repository_id, default_branch):
+def check_if_branch_protected(repository, repository_id, default_branch, rules=None):
     """ This function checks if branch protection is already enabled for default branch"""
-    query = '''
-    query {
-    repository(owner: "%s", name: "%s") {
-        branchProtectionRules(first: 100) {
-        nodes {
-            id
-            requiredStatusCheckContexts
-            pattern
-        }
-        }
-    }
-    }
-    ''' % (organisation, repository)
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
-        response.raise_for_status()
-        data = response.json().get("data", {}).get("repository", {}).get("branchProtectionRules", {}).get("nodes", [])
-        response_data = json.loads(response.text)
-        protected_branches = [rule["pattern"] for rule in response_data["data"]["repository"]["branchProtectionRules"]["nodes"]]
+        if rules is None:
+            rules = fetch_branch_protection_rules(organisation, repository, headers)
+        protected_branches = [rule["pattern"] for rule in rules]
         if default_branch not in protected_branches:
             create_branchprotection_rule(repository, repository_id, default_branch)
         else:
-            for rule in response_data["data"]["repository"]["branchProtectionRules"]["nodes"]:
+            for rule in rules:
                 if rule["pattern"] == default_branch:
                     protection_rule_id = rule["id"]
                     protected_status_check_context = rule["requiredStatusCheckContexts"]
@@ -163,7 +137,7 @@ def check_if_branch_protected(repository, repository_id, default_branch):
                     updated_status_check_context = '['+temp_list+']'
                     update_branchprotection_rule(repository, protection_rule_id, default_branch, updated_status_check_context)       
     except requests.exceptions.RequestException as e:
-        print(f"Failed to query GitHub GraphQL API. Status code: {response.text} {str(e)}")
+        print(f"Failed to query GitHub GraphQL API. {str(e)}")
         raise ValueError("Failed to check branch protection rule for {repository}")
 
 def create_branchprotection_rule(repository, repository_id, default_branch):
@@ -192,7 +166,7 @@ def create_branchprotection_rule(repository, repository_id, default_branch):
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         try:
             data = response.json().get("data", {}).get("createBranchProtectionRule", {}).get("branchProtectionRule", {})
@@ -230,7 +204,7 @@ def update_branchprotection_rule(repository, protection_rule_id, default_branch,
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         try:
             data = response.json().get("data", {}).get("updateBranchProtectionRule", {}).get("branchProtectionRule", {})
@@ -246,9 +220,12 @@ def update_branchprotection_rule(repository, protection_rule_id, default_branch,
 
 main()
 
-for repo in repositories:
-    try:
-        check_repo_exist(repo)
-    except Exception as e:
-        print(f'Error while working on {repo}: {str(e)}')
-        continue
+try:
+    snapshots = fetch_repository_snapshots(organisation, repositories, headers)
+except requests.exceptions.RequestException as e:
+    print(f'Failed to fetch the repository snapshots, querying repositories one by one: {str(e)}')
+    snapshots = {}
+errors = reconcile_branch_protection([(repo, check_repo_exist, (repo, snapshots.get(repo))) for repo in repositories])
+for repo, error in zip(repositories, errors):
+    if error:
+        print(f'Error while working on {repo}: {str(error)}')
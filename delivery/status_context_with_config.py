@@ -11,6 +11,11 @@ import yaml
 from ruamel.yaml import YAML
 
 sys.path.append(f'{os.path.dirname(__file__)}/..')
+from utils.github_client import github_http
+from utils.bpr_reconciler import reconcile_branch_protection
+from utils.repo_snapshot import fetch_repository_snapshots, fetch_branch_protection_rules
+from utils.repo_cache import repo_metadata_cache
+from utils.secret_access import reconcile_secret_access
 
 api_url = 'https://api.github.com/graphql'
 github_token = os.environ['GITHUB_APP_TOKEN']
@@ -40,12 +45,18 @@ def get_config(item='', data_type=any):
 def main(module_name='', module_description='', repositories=[], default_managed_refspec=None):
     # Extract repository names
     repository_list = [reps['name'] for reps in repositories]
-    if bool(repository_list):
-        common_secrets = get_config(item='common-secrets', data_type=[])
-        create_list_repo_ids(repository_list, common_secrets)
-    else:
+    if not bool(repository_list):
         print_red("Unable to fetch repository names from input file")
+    # secret -> repositories that need access to it, applied in bulk at the end
+    secret_repositories = {secret: list(repository_list) for secret in get_config(item='common-secrets', data_type=[])}
 
+    try:
+        snapshots = fetch_repository_snapshots(organisation, repository_list, headers)
+    except requests.exceptions.RequestException as e:
+        print_red(f'Failed to fetch the repository snapshots, querying repositories one by one: {str(e)}')
+        snapshots = {}
+
+    chains = []
     for repository in repositories:
         repo_name = repository.get('name')
         refspec = repository.get('refspec')
@@ -58,6 +69,12 @@ def main(module_name='', module_description='', repositories=[], default_managed
             language = ', '.join(language)
         except IndentationError:
             language = ''
+        chains.append((repo_name, check_repo_exist, (repo_name, refspec, optional_workflows, language, snapshots.get(repo_name))))
+    # Branch protection is reconciled concurrently
+    errors = reconcile_branch_protection(chains)
+
+    for repository, error in zip(repositories, errors):
+        repo_name = repository.get('name')
         try:
             needs = repository.get('needs', [])
             specific_secrets = get_config(item='specific-secrets', data_type=[])
@@ -69,62 +86,39 @@ def main(module_name='', module_description='', repositories=[], default_managed
                 spl_secrets = [item for sublist in spl_secrets for item in sublist]
         except IndentationError:
             spl_secrets = []
-        try:
-            check_repo_exist(repo_name, refspec, optional_workflows, language)
-        except Exception as e:
-            print_red(f'Error while working on {repo_name}: {str(e)}')
+        if error:
+            print_red(f'Error while working on {repo_name}: {str(error)}')
             continue
-        try:
-            repo_name = list(repo_name.split(" "))
-            create_list_repo_ids(repo_name, spl_secrets)
-        except Exception as e:
-            print_red(f'Error while updating specific secrets {spl_secrets} on {repo_name}: {str(e)}')
+        for secret in spl_secrets:
+            secret_repositories.setdefault(secret, []).append(repo_name)
+    update_secret_access_to_repos(secret_repositories)
 
-def create_list_repo_ids(repositories, secrets):
-    """This functions creates list of repository ids where secret access needs to be updated"""
-    auth_header = {'Authorization': 'token '+github_token, 'X-GitHub-Api-Version': '2022-11-28', 'Accept': 'application/vnd.github+json'}
-    repository_ids = []
-    for repo in repositories:
-        githubapi = f"https://api.github.com/repos/{organisation}/{repo}"
-        repo_response = requests.get(githubapi, headers=auth_header)
-        repository_ids.append(repo_response.json()['id'])
-    if bool(repository_ids):
-        update_secret_access_to_repo(repository_ids, secrets)
-    else:
-        print_red("Unable to create list of repository ids")
-
-def update_secret_access_to_repo(repository_ids, secrets):
-    """This function adds the repositories for to access Organisation secrets"""
+def update_secret_access_to_repos(secret_repositories):
+    """This function gives the repositories access to the Organisation secrets, one PUT per changed secret"""
+    if not secret_repositories:
+        print("Secrets are not defined in deployer-config.yaml file")
+        return
     headers = {
         'Accept': 'application/vnd.github+json',
         'Authorization': f'Bearer {github_token}',
         'X-GitHub-Api-Version': '2022-11-28'
     }
-    if len(secrets) != 0:
-        for secret in secrets:
-            url = f"https://api.github.com/orgs/{organisation}/actions/secrets/{secret}/repositories"
-            try:
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
-                response_data = json.loads(response.text)
-                existing_repo_ids = [rule ["id"] for rule in response_data["repositories"]]
-                repo_ids = list(set(existing_repo_ids + repository_ids))
-                data = {
-                    "selected_repository_ids": repo_ids
-                }
-            except requests.exceptions.RequestException as e:
-                print_red(f'Error while fetching existing repository names for {secret} secret')
-            try:
-                response = requests.put(url, headers=headers, json=data)
-                response.raise_for_status()
-                print_green(f'Updated access to the {secret} secret for given repos')
-            except requests.exceptions.RequestException as e:
-                print_red(f"Failed to update the secret access for repository. Status code: {response.status_code} {str(e)}")
-    else:
-        print("Secrets are not defined in deployer-config.yaml file")
+    try:
+        reconcile_secret_access(organisation, secret_repositories, headers, log=print_green)
+    except requests.exceptions.RequestException as e:
+        print_red(f'Failed to list the repositories of {organisation}: {str(e)}')
 
-def check_repo_exist(repository, refspec, optional_workflows, language):
+def check_repo_exist(repository, refspec, optional_workflows, language, snapshot=None):
     """ This Function checks if given Github Repo exists """
+    if not snapshot:
+        # id and default branch from the repository metadata cache, the rules are queried
+        cached = repo_metadata_cache(organisation, headers).get(repository)
+        if cached:
+            snapshot = {'id': cached['node_id'], 'default_branch': cached['default_branch'],
+                        'branch_protection_rules': None}
+    if snapshot:
+        # already fetched in bulk by fetch_repository_snapshots()
+        return get_default_branch(snapshot['id'], repository, refspec, optional_workflows, language, snapshot=snapshot)
     query = f'''
     query {{
         repository(owner: "{organisation}", name: "{repository}") {{
@@ -133,7 +127,7 @@ def check_repo_exist(repository, refspec, optional_workflows, language):
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         repository_id = response.json().get("data", {}).get("repository")['id']
         if repository_id:
@@ -145,8 +139,11 @@ def check_repo_exist(repository, refspec, optional_workflows, language):
         print_red(f"Failed to query GitHub GraphQL API. Status code: {response.status_code} {str(e)}")
         raise ValueError("The repository '{repository}' does not exist.")
 
-def get_default_branch(repository_id, repository, refspec, optional_workflows, language):
+def get_default_branch(repository_id, repository, refspec, optional_workflows, language, snapshot=None):
     """ This Function gets default branch for given repo """
+    if snapshot:
+        return check_if_branch_protected(repository, repository_id, snapshot['default_branch'], refspec, optional_workflows, language,
+                                         rules=snapshot['branch_protection_rules'])
     query = f'''
     query {{
     repository(owner: "{organisation}", name: "{repository}") {{
@@ -162,45 +159,30 @@ def get_default_branch(repository_id, repository, refspec, optional_workflows, l
     }
     
     try:
-        response = requests.post(api_url, headers=headers, json={'query': query, 'variables': variables})
+        response = github_http.post(api_url, headers=headers, json={'query': query, 'variables': variables})
         response.raise_for_status()
         default_branch = response.json()['data']['repository']['defaultBranchRef']['name']
         check_if_branch_protected(repository, repository_id, default_branch, refspec, optional_workflows, language)
     except requests.exceptions.RequestException as e:
         print_red(f"Failed to retrieve the default branch. Status code:, {str(e)}")
 
-def check_if_branch_protected(repository, repository_id, default_branch, refspec, optional_workflows, language):
+def check_if_branch_protected(repository, repository_id, default_branch, refspec, optional_workflows, language, rules=None):
     """ This function checks if branch protection is already enabled for default branch"""
-    query = '''
-    query {
-    repository(owner: "%s", name: "%s") {
-        branchProtectionRules(first: 100) {
-        nodes {
-            id
-            requiredStatusCheckContexts
-            pattern
-        }
-        }
-    }
-    }
-    ''' % (organisation, repository)
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
-        response.raise_for_status()
-        data = response.json().get("data", {}).get("repository", {}).get("branchProtectionRules", {}).get("nodes", [])
-        response_data = json.loads(response.text)
-        protected_branches = [rule["pattern"] for rule in response_data["data"]["repository"]["branchProtectionRules"]["nodes"]]
+        if rules is None:
+            rules = fetch_branch_protection_rules(organisation, repository, headers)
+        protected_branches = [rule["pattern"] for rule in rules]
         if default_branch not in protected_branches:
             create_branchprotection_rule(repository, repository_id, default_branch, refspec, optional_workflows, language)
         else:
-            for rule in response_data["data"]["repository"]["branchProtectionRules"]["nodes"]:
+            for rule in rules:
                 if rule["pattern"] == default_branch:
                     protection_rule_id = rule["id"]
                     protected_status_check_context = rule["requiredStatusCheckContexts"]
                     updated_status_check_context = evaluate_context_for_bpr(refspec, repository, protected_status_check_context)
                     update_branchprotection_rule(repository, protection_rule_id, default_branch, updated_status_check_context)       
     except requests.exceptions.RequestException as e:
-        print_red(f"Failed to query GitHub GraphQL API. Status code: {response.text} {str(e)}")
+        print_red(f"Failed to query GitHub GraphQL API. {str(e)}")
         create_branchprotection_rule(repository, repository_id, default_branch, refspec, optional_workflows, language)
 
 def create_branchprotection_rule(repository, repository_id, default_branch, refspec, optional_workflows, language):
@@ -228,7 +210,7 @@ def create_branchprotection_rule(repository, repository_id, default_branch, refs
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         try:
             data = response.json().get("data", {}).get("createBranchProtectionRule", {}).get("branchProtectionRule", {})
@@ -266,7 +248,7 @@ def update_branchprotection_rule(repository, protection_rule_id, default_branch,
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         try:
             data = response.json().get("data", {}).get("updateBranchProtectionRule", {}).get("branchProtectionRule", {})
@@ -293,11 +275,12 @@ def evaluate_context_for_bpr(refspec, repository, protected_status_check_context
     # Get lanaguage variable value for this repository
     try:
         lang_variable = get_config(item='lang_variable', data_type='')
-        response = requests.get(url=f"https://api.github.com/repos/{organisation}/{repository}/actions/variables/{lang_variable}", headers=headers)
-        response.raise_for_status()
-        language = response.json()['value']
+        language = repo_metadata_cache(organisation, headers).variable(repository, lang_variable)
         default_language_context = get_config(item='default_language_context', data_type={})
-        if language in default_language_context:
+        if language is None:
+            print_red(f'{lang_variable} repository variable not found in {repository}.')
+            language_context = []
+        elif language in default_language_context:
             language_context = default_language_context[language]
         else:
             print(f"{lang_variable} status check context not found in deployer-config.yaml")
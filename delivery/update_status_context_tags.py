@@ -5,11 +5,17 @@ import sys
 import yaml
 import os
 
+sys.path.append(f'{os.path.dirname(__file__)}/..')
+from utils.github_client import github_http
+from utils.bpr_reconciler import reconcile_branch_protection
+from utils.repo_snapshot import fetch_repository_snapshots, fetch_branch_protection_rules
+from utils.repo_cache import repo_metadata_cache
+from utils.secret_access import reconcile_secret_access
+
 api_url = 'https://api.github.com/graphql'
 github_token = os.environ['GITHUB_APP_TOKEN']
 organisation = 'glcp'
 repositories = []
-repository_ids = []
 tags_1x_status_context = ['tag1', 'tag1.1'] # Update the status check context for tag v1.1.X
 tags_2x_status_context = ['tag2', 'tag2.1', 'tag2.2'] # Update the status check context for tag v2.1.X
 tags_3x_status_context = ['tag3', 'tag3.1', 'tag3.2'] # Update the status check context for tag v3.1.X
@@ -57,48 +63,28 @@ def main():
         print_red("Unable to fetch repository names from input file")
 
 def create_list_repo_ids(repositories):
-    """This functions creates list of repository ids where secret access needs to be updated"""
-    auth_header = {'Authorization': 'token '+github_token, 'X-GitHub-Api-Version': '2022-11-28', 'Accept': 'application/vnd.github+json'}
-    repository_ids = []
-    for repo in repositories:
-        githubapi = "https://api.github.com/repos/"+organisation+"/"+repo
-        repo_response = requests.get(githubapi, headers=auth_header)
-        repository_ids.append(repo_response.json()['id'])
-    globals()["repository_ids"] = repository_ids
-    if bool(repository_ids):
-        update_secret_access_to_repo(repository_ids)
-    else:
-        print_red("Unable to create list of repository ids")
-
-def update_secret_access_to_repo(repository_ids):
-    """This function adds the repositories for to access Organisation secrets"""
+    """This function gives the repositories access to the Organisation secrets, one PUT per changed secret"""
     headers = {
         'Accept': 'application/vnd.github+json',
         'Authorization': f'Bearer {github_token}',
         'X-GitHub-Api-Version': '2022-11-28'
     }
-    for secret in secrets:
-        url = "https://api.github.com/orgs/"+organisation+"/actions/secrets/"+secret+"/repositories"
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            response_data = json.loads(response.text)
-            existing_repo_ids = [rule ["id"] for rule in response_data["repositories"]]
-            repo_ids = list(set(existing_repo_ids + repository_ids))
-            data = {
-                "selected_repository_ids": repo_ids
-            }
-        except requests.exceptions.RequestException as e:
-            print_red(f'Error while fetching existing repository names for {secret} secret')
-        try:
-            response = requests.put(url, headers=headers, json=data)
-            response.raise_for_status()
-            print_green(f'Updated access to the {secret} secret for all given repos')
-        except requests.exceptions.RequestException as e:
-            print_red(f"Failed to update the secret access for repository. Status code: {response.status_code} {str(e)}")
+    try:
+        reconcile_secret_access(organisation, {secret: repositories for secret in secrets}, headers)
+    except requests.exceptions.RequestException as e:
+        print_red(f'Failed to list the repositories of {organisation}: {str(e)}')
 
-def check_repo_exist(repository, refspec, optional_workflows, language):
+def check_repo_exist(repository, refspec, optional_workflows, language, snapshot=None):
     """ This Function checks if given Github Repo exists """
+    if not snapshot:
+        # id and default branch from the repository metadata cache, the rules are queried
+        cached = repo_metadata_cache(organisation, headers).get(repository)
+        if cached:
+            snapshot = {'id': cached['node_id'], 'default_branch': cached['default_branch'],
+                        'branch_protection_rules': None}
+    if snapshot:
+        # already fetched in bulk by fetch_repository_snapshots()
+        return get_default_branch(snapshot['id'], repository, refspec, optional_workflows, language, snapshot=snapshot)
     query = f'''
     query {{
         repository(owner: "{organisation}", name: "{repository}") {{
@@ -107,7 +93,7 @@ def check_repo_exist(repository, refspec, optional_workflows, language):
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         repository_id = response.json().get("data", {}).get("repository")['id']
         if repository_id:
@@ -119,8 +105,11 @@ def check_repo_exist(repository, refspec, optional_workflows, language):
         print_red(f"Failed to query GitHub GraphQL API. Status code: {response.status_code} {str(e)}")
         raise ValueError("The repository '{repository}' does not exist.")
 
-def get_default_branch(repository_id, repository, refspec, optional_workflows, language):
+def get_default_branch(repository_id, repository, refspec, optional_workflows, language, snapshot=None):
     """ This Function gets default branch for given repo """
+    if snapshot:
+        return check_if_branch_protected(repository, repository_id, snapshot['default_branch'], refspec, optional_workflows, language,
+                                         rules=snapshot['branch_protection_rules'])
     query = f'''
     query {{
     repository(owner: "{organisation}", name: "{repository}") {{
@@ -136,7 +125,7 @@ def get_default_branch(repository_id, repository, refspec, optional_workflows, l
     }
     
     try:
-        response = requests.post(api_url, headers=headers, json={'query': query, 'variables': variables})
+        response = github_http.post(api_url, headers=headers, json={'query': query, 'variables': variables})
         response.raise_for_status()
         default_branch = response.json()['data']['repository']['defaultBranchRef']['name']
         check_if_branch_protected(repository, repository_id, default_branch, refspec, optional_workflows, language)
@@ -144,38 +133,23 @@ def get_default_branch(repository_id, repository, refspec, optional_workflows, l
         print_red('Failed to retrieve the default branch. Status code:', response.status_code)
         raise ValueError(f'Failed to retrive default branch for repository {repository} {str(e)}.')
 
-def check_if_branch_protected(repository, repository_id, default_branch, refspec, optional_workflows, language):
+def check_if_branch_protected(repository, repository_id, default_branch, refspec, optional_workflows, language, rules=None):
     """ This function checks if branch protection is already enabled for default branch"""
-    query = '''
-    query {
-    repository(owner: "%s", name: "%s") {
-        branchProtectionRules(first: 100) {
-        nodes {
-            id
-            requiredStatusCheckContexts
-            pattern
-        }
-        }
-    }
-    }
-    ''' % (organisation, repository)
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
-        response.raise_for_status()
-        data = response.json().get("data", {}).get("repository", {}).get("branchProtectionRules", {}).get("nodes", [])
-        response_data = json.loads(response.text)
-        protected_branches = [rule["pattern"] for rule in response_data["data"]["repository"]["branchProtectionRules"]["nodes"]]
+        if rules is None:
+            rules = fetch_branch_protection_rules(organisation, repository, headers)
+        protected_branches = [rule["pattern"] for rule in rules]
         if default_branch not in protected_branches:
             create_branchprotection_rule(repository, repository_id, default_branch, refspec, optional_workflows, language)
         else:
-            for rule in response_data["data"]["repository"]["branchProtectionRules"]["nodes"]:
+            for rule in rules:
                 if rule["pattern"] == default_branch:
                     protection_rule_id = rule["id"]
                     protected_status_check_context = rule["requiredStatusCheckContexts"]
                     updated_status_check_context = evaluate_context_for_bpr(refspec, repository, protected_status_check_context)
                     update_branchprotection_rule(repository, protection_rule_id, default_branch, updated_status_check_context)       
     except requests.exceptions.RequestException as e:
-        print_red(f"Failed to query GitHub GraphQL API. Status code: {response.text} {str(e)}")
+        print_red(f"Failed to query GitHub GraphQL API. {str(e)}")
         raise ValueError("Failed to check branch protection rule for {repository}")
 
 def create_branchprotection_rule(repository, repository_id, default_branch, refspec, optional_workflows, language):
@@ -203,7 +177,7 @@ def create_branchprotection_rule(repository, repository_id, default_branch, refs
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         try:
             data = response.json().get("data", {}).get("createBranchProtectionRule", {}).get("branchProtectionRule", {})
@@ -241,7 +215,7 @@ def update_branchprotection_rule(repository, protection_rule_id, default_branch,
     }}
     '''
     try:
-        response = requests.post(api_url, json={"query": query}, headers=headers)
+        response = github_http.post(api_url, json={"query": query}, headers=headers)
         response.raise_for_status()
         try:
             data = response.json().get("data", {}).get("updateBranchProtectionRule", {}).get("branchProtectionRule", {})
@@ -270,12 +244,9 @@ def evaluate_context_for_bpr(refspec, repository, protected_status_check_context
         tag_status_context = []
 
     # Get lanaguage variable value for this repository
-    try:
-        response = requests.get(url="https://api.github.com/repos/"+organisation+"/"+repository+"/actions/variables/"+lang_variable, headers=headers)
-        response.raise_for_status()
-        language = response.json()['value']
-    except AttributeError:
-        print_red(f'Failed to retrive value of variable {lang_variable} from {repository}. Response: {response.text}')
+    language = repo_metadata_cache(organisation, headers).variable(repository, lang_variable)
+    if language is None:
+        print_red(f'Variable {lang_variable} is not set in {repository}.')
     match language:
         case "java":
             global java_status_context
@@ -308,6 +279,13 @@ with open(file_path, 'r') as file:
 
 # Parse the YAML content
 parsed_yaml = yaml.safe_load(yaml_content)
+try:
+    snapshots = fetch_repository_snapshots(organisation, [repository.get('name') for module in parsed_yaml.get('modules', [])
+                                                          for repository in module.get('repositories', [])], headers)
+except requests.exceptions.RequestException as e:
+    print_red(f'Failed to fetch the repository snapshots, querying repositories one by one: {str(e)}')
+    snapshots = {}
+chains = []
 for module in parsed_yaml.get('modules', []):
     repositories = module.get('repositories', [])
     for repository in repositories:
@@ -322,8 +300,9 @@ for module in parsed_yaml.get('modules', []):
             language = ', '.join(language)
         except IndentationError:
             language = ''
-        try:
-            check_repo_exist(repo_name, refspec, optional_workflows, language)
-        except Exception as e:
-            print_red(f'Error while working on {repo_name}: {str(e)}')
-            continue
+        chains.append((repo_name, check_repo_exist, (repo_name, refspec, optional_workflows, language, snapshots.get(repo_name))))
+
+errors = reconcile_branch_protection(chains)
+for (repo_name, _, _), error in zip(chains, errors):
+    if error:
+        print_red(f'Error while working on {repo_name}: {str(error)}')
@@ -1,11 +1,41 @@
 import os
 import sys
 import yaml
-import json
+import argparse
+import traceback
 import importlib.util
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+logdir = 'logdir/modules'
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Deploy the modules of workflow-deployment.yaml')
+    parser.add_argument('--force', action='store_true',
+                        help='re-evaluate every repository, including the ones recorded as converged')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='deploy every repository again instead of resuming an interrupted run')
+    parser.add_argument('--jobs', type=int, default=int(os.environ.get('MODULE_CONCURRENCY', '1')),
+                        help='number of modules run in parallel worker processes (default: 1, serial)')
+    parser.add_argument('--shard-index', type=int,
+                        help='deploy only the repositories of this shard (0 based), see --shard-count')
+    parser.add_argument('--shard-count', type=int,
+                        help='number of runners the repositories are split across')
+    parser.add_argument('--merge-shards', action='store_true',
+                        help='publish the results written by the shards of a sharded run')
+    args = parser.parse_args()
+    if args.force:
+        os.environ['DEPLOYER_FORCE'] = 'true'
+    if args.no_resume:
+        os.environ['DEPLOYER_RESUME'] = 'false'
+    if args.shard_count is not None:
+        os.environ['DEPLOYER_SHARD_COUNT'] = str(args.shard_count)
+    if args.shard_index is not None:
+        os.environ['DEPLOYER_SHARD_INDEX'] = str(args.shard_index)
+    if args.merge_shards:
+        os.environ['DEPLOYER_MODE'] = 'merge'
+
     if not 'GITHUB_APP_TOKEN' in os.environ:
         print(f'ERROR: Env var "GITHUB_APP_TOKEN" must to be set.')
         sys.exit(1)
@@ -16,14 +46,125 @@ def main():
     modules=data['modules']
     print(f'workflow deployment config:\n{yaml.dump(modules, default_flow_style=False)}')
 
-    for i in modules:
-        module_name=i.get('name')
-        module_description=i.get('description')
-        repositories=i.get('repositories', [])
-        module=import_module(module_name)
-        module.main(module_name=module_name,
-                    module_description=module_description,
-                    repositories=repositories)
+    dependencies = module_dependencies(modules)
+    if args.jobs <= 1:
+        for index in schedule_order(dependencies):
+            run_module(modules[index])
+    elif not run_modules_in_parallel(modules, dependencies, args.jobs):
+        sys.exit(1)
+
+def module_dependencies(modules):
+    """
+    Returns {index: set of indexes} of the modules that each module has to wait for.  A module
+    declares them with "depends_on: [<module name>, ...]" in workflow-deployment.yaml.
+    """
+    indexes_by_name = {}
+    for index, i in enumerate(modules):
+        indexes_by_name.setdefault(i.get('name'), set()).add(index)
+    dependencies = {}
+    for index, i in enumerate(modules):
+        dependencies[index] = set()
+        for name in i.get('depends_on', []):
+            if name not in indexes_by_name:
+                raise Exception(f'module {i.get("name")} depends on unknown module {name}')
+            dependencies[index] |= indexes_by_name[name] - {index}
+    schedule_order(dependencies)
+    return dependencies
+
+def schedule_order(dependencies):
+    """Returns the module indexes in an order that satisfies the dependencies (config order otherwise)."""
+    order = []
+    done = set()
+    while len(order) < len(dependencies):
+        ready = [index for index, deps in dependencies.items() if index not in done and deps <= done]
+        if not ready:
+            raise Exception(f'circular depends_on between modules {sorted(set(dependencies) - done)}')
+        order.append(ready[0])
+        done.add(ready[0])
+    return order
+
+def module_outputs(module_config):
+    """
+    The repository clones a module makes in the working directory.  The outputs shared
+    by every module (workflows-deployed.yaml, the devx-sonarqube commit) are published
+    under utils/publish_lock.py instead.
+    """
+    return {repo.get('name') for repo in module_config.get('repositories', [])}
+
+def run_modules_in_parallel(modules, dependencies, jobs):
+    """
+    Runs every module in a worker process as soon as the modules it depends on have
+    completed and no running module deploys to the same repositories (module_outputs()).  The
+    output of each module goes to logdir/modules/<index>-<name>.log.  On the first
+    failure no further module is started (the running ones are allowed to finish) and
+    False is returned.
+    """
+    os.makedirs(logdir, exist_ok=True)
+    pending = dict(dependencies)
+    outputs = {index: module_outputs(modules[index]) for index in pending}
+    done = set()
+    failed = []
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while running or (pending and not failed):
+            if not failed:
+                for index in [index for index, deps in pending.items() if deps <= done]:
+                    if any(outputs[index] & outputs[other] for other in running.values()):
+                        continue
+                    del pending[index]
+                    log_file = f'{logdir}/{index}-{modules[index].get("name")}.log'
+                    print(f'starting module {modules[index].get("name")}, log: {log_file}')
+                    running[executor.submit(run_module_process, modules[index], log_file)] = index
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = running.pop(future)
+                try:
+                    status, log_file = future.result()
+                except BrokenProcessPool as e:
+                    # the worker process died (killed, out of memory...) without reporting a status
+                    print(f'ERROR: module {modules[index].get("name")} worker process terminated abruptly: {e}')
+                    failed.append(index)
+                    continue
+                print(f'module {modules[index].get("name")} finished with exit status {status}, log: {log_file}')
+                if status:
+                    failed.append(index)
+                    with open(log_file) as log_f:
+                        print(''.join(log_f.readlines()[-50:]))
+                else:
+                    done.add(index)
+    if failed:
+        print(f'ERROR: module(s) {[modules[index].get("name") for index in failed]} failed, '
+              f'not started: {[modules[index].get("name") for index in pending]}')
+    return not failed
+
+def run_module_process(module_config, log_file):
+    """Worker process entry point: runs one module with its stdout/stderr redirected to log_file."""
+    with open(log_file, 'w') as log_f:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # redirect the file descriptors so that the output of the git subprocesses is captured too
+        os.dup2(log_f.fileno(), 1)
+        os.dup2(log_f.fileno(), 2)
+        try:
+            run_module(module_config)
+            status = 0
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return status, log_file
+
+def run_module(module_config):
+    module_name=module_config.get('name')
+    module_description=module_config.get('description')
+    repositories=module_config.get('repositories', [])
+    module=import_module(module_name)
+    module.main(module_name=module_name,
+                module_description=module_description,
+                repositories=repositories)
 
 #This function will load the  specified module dynamically from productModules folder.
 def import_module(the_module_name):
@@ -36,4 +177,5 @@ def import_module(the_module_name):
     return module
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,9 @@ import sys
 import yaml
 import os
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from utils.bpr_reconciler import reconcile_branch_protection
+
 api_url = 'https://api.github.com/graphql'
 github_token = os.environ['APP_TOKEN']
 organisation = 'githubactions-omkar'
@@ -316,6 +319,7 @@ with open(file_path, 'r') as file:
 
 # Parse the YAML content
 parsed_yaml = yaml.safe_load(yaml_content)
+chains = []
 for module in parsed_yaml.get('modules', []):
     repositories = module.get('repositories', [])
     for repository in repositories:
@@ -330,8 +334,9 @@ for module in parsed_yaml.get('modules', []):
             language = ', '.join(language)
         except IndentationError:
             language = ''
-        try:
-            check_repo_exist(repo_name, refspec, optional_workflows, language)
-        except Exception as e:
-            print(f'Error while working on {repo_name}: {str(e)}')
-            continue
+        chains.append((repo_name, check_repo_exist, (repo_name, refspec, optional_workflows, language)))
+
+errors = reconcile_branch_protection(chains)
+for (repo_name, _, _), error in zip(chains, errors):
+    if error:
+        print(f'Error while working on {repo_name}: {str(error)}')
@@ -0,0 +1,22 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple, Union
+
+
+def reconcile_branch_protection(chains: List[Tuple[str, Callable, tuple]],
+                                max_in_flight=None) -> List[Union[Exception, None]]:
+    """
+    Runs the branch-protection chain (check_repo_exist -> get_default_branch ->
+    check_if_branch_protected -> create/update rule) of many repositories concurrently.
+
+    "chains" is a list of (repo_name, check_repo_exist, args); each chain still runs its
+    steps in order, so the create-vs-update decision is unchanged, but up to
+    "max_in_flight" (BPR_MAX_IN_FLIGHT, 16 by default) repositories are in flight at once.
+    Returns the exception raised by each chain (None if it succeeded), in the order of
+    "chains"; a failing repository does not stop the others.
+    """
+    if max_in_flight is None:
+        max_in_flight = int(os.environ.get('BPR_MAX_IN_FLIGHT', '16'))
+    with ThreadPoolExecutor(max_workers=max(max_in_flight, 1), thread_name_prefix='bpr') as executor:
+        futures = [executor.submit(chain, *args) for _, chain, args in chains]
+        return [future.exception() for future in futures]
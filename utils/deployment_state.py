@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List
+
+import yaml
+
+
+class DeploymentState:
+    """
+    Persistent (SQLite) state of the workflow deployer.
+
+    "repositories" records, per repository, the inputs of the last run that found the
+    repository converged: the refspec, the commit it resolved to, the SHA of the remote
+    .github/workflows tree, the default branch and the repo options.  As long as none of
+    them change the repository does not need to be evaluated again.
+
+    "workflows" records every workflow deployed to a repository with its last update
+    time, from which workflows-deployed.yaml can be regenerated (see report()).
+
+    "journal" is the checkpoint journal of the run in progress: the result of every
+    repository is committed as soon as it is deployed, under a key identifying the run
+    (see journal_record()), so that a run that dies halfway can be resumed without
+    deploying the finished repositories again.  It is cleared once the run completes,
+    checkpoints older than the caller's maximum age are dropped by expire_journal().
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS repositories (
+                    repo TEXT PRIMARY KEY,
+                    refspec TEXT,
+                    refspec_commit TEXT,
+                    tree_sha TEXT,
+                    default_branch TEXT,
+                    options TEXT,
+                    workflows TEXT,
+                    converged_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS workflows (
+                    repo TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    updated TEXT,
+                    PRIMARY KEY (repo, name)
+                );
+                CREATE TABLE IF NOT EXISTS journal (
+                    run_key TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    result TEXT,
+                    finished_at TEXT,
+                    PRIMARY KEY (run_key, repo)
+                );
+            ''')
+
+    def converged_workflows(self, repo: str, refspec: str, refspec_commit: str, tree_sha: str,
+                            default_branch: str, options: str):
+        """
+        Returns the in-sync workflows recorded when the repository last converged with
+        exactly these inputs, or None if it has to be evaluated again.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT workflows FROM repositories WHERE repo = ? AND refspec IS ? AND refspec_commit = ? '
+                'AND tree_sha = ? AND default_branch = ? AND options = ? AND converged_at IS NOT NULL',
+                (repo, refspec, refspec_commit, tree_sha, default_branch, options)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def mark_converged(self, repo: str, refspec: str, refspec_commit: str, tree_sha: str,
+                       default_branch: str, options: str, workflows: List[str], timestamp: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO repositories VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (repo, refspec, refspec_commit, tree_sha, default_branch, options, json.dumps(workflows), timestamp))
+
+    def record_deploy(self, repo: str, refspec: str, old_workflows: List[Dict], new_workflows: List[Dict]):
+        """
+        Records the workflows found in (old) and deployed to (new) a repository.  The
+        convergence record does not need to be reset: any push changes the tree SHA.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO repositories (repo, refspec) VALUES (?, ?) '
+                'ON CONFLICT(repo) DO UPDATE SET refspec = excluded.refspec',
+                (repo, refspec))
+            self.conn.executemany('INSERT OR IGNORE INTO workflows (repo, name) VALUES (?, ?)',
+                                  [(repo, wf['name']) for wf in old_workflows])
+            self.conn.executemany('INSERT OR REPLACE INTO workflows (repo, name, updated) VALUES (?, ?, ?)',
+                                  [(repo, wf['name'], wf['updated']) for wf in new_workflows])
+
+    def journal_record(self, run_key: str, repo: str, result, timestamp: str):
+        """Checkpoints the (JSON serializable) result of a repository; committed before returning."""
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?)',
+                              (run_key, repo, json.dumps(result), timestamp))
+
+    def journal_results(self, run_key: str) -> Dict:
+        """Returns {repo: result} of the repositories already finished by the run "run_key"."""
+        with self.lock:
+            rows = self.conn.execute('SELECT repo, result FROM journal WHERE run_key = ?', (run_key,)).fetchall()
+        return {repo: json.loads(result) for repo, result in rows}
+
+    def expire_journal(self, before: str):
+        """Drops the checkpoints of every run finished before "before" (same format as the timestamps)."""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM journal WHERE finished_at < ?', (before,))
+
+    def clear_journal(self, run_key: str):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM journal WHERE run_key = ?', (run_key,))
+
+    def report(self) -> Dict:
+        """Returns the deployments in the workflows-deployed.yaml format."""
+        report = {}
+        with self.lock:
+            refspecs = dict(self.conn.execute('SELECT repo, refspec FROM repositories'))
+            rows = self.conn.execute('SELECT repo, name, updated FROM workflows ORDER BY repo, rowid').fetchall()
+        for repo, name, updated in rows:
+            entry = report.setdefault(repo, {'refspec': refspecs.get(repo), 'workflows': []})
+            entry['workflows'].append({'name': name, 'updated': updated} if updated else {'name': name})
+        return {'repositories': report}
+
+    def export_report(self, report_filename: str):
+        with open(report_filename, 'w') as report_f:
+            report_f.write(yaml.dump(self.report(), default_flow_style=False, sort_keys=False))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
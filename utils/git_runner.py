@@ -0,0 +1,105 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple, Union
+
+
+class GitRunner:
+    """
+    Runs git directly (argv lists, no /bin/sh) in the working directory given by "cwd"
+    instead of a "cd <dir>; git ..." shell string.
+
+    - add() and rm() take all the paths of a repository in a single git invocation, so
+      a repository with many workflows costs one process instead of one per file
+    - failures are logged with stdout/stderr the same way run_subprocess() did, with the
+      "redact" string (e.g. a token embedded in a clone URL) masked out
+    - per git subcommand count, wall time and failures, see log_metrics()
+
+    Every method returns (exit code, stdout, stderr) like run_subprocess().
+    """
+
+    def __init__(self, logger: Union[logging.Logger, None] = None, timeout=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def run(self, args: Sequence[str], cwd=None, redact=None, ok_codes=(0,)) -> Tuple[int, bytes, bytes]:
+        cmd = ['git', *args]
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  start_new_session=True, timeout=self.timeout)
+            ec, out, err = proc.returncode, proc.stdout, proc.stderr
+        except subprocess.TimeoutExpired as e:
+            ec, out, err = -1, e.stdout or b'', e.stderr or b'timed out'
+        except OSError as e:
+            # missing cwd or git binary
+            ec, out, err = -1, b'', str(e).encode()
+        self.record(args[0], time.monotonic() - start, failed=ec not in ok_codes)
+        if ec not in ok_codes:
+            shown = ' '.join(cmd)
+            if redact:
+                shown = shown.replace(redact, '***')
+                err = err.replace(redact.encode(), b'***')
+            self.logger.error(f'cmd: {shown} (in {cwd or os.getcwd()})')
+            self.logger.error(f'exit code: {ec}')
+            self.logger.error(f'stdout: {out.decode()}')
+            self.logger.error(f'stderr: {err.decode()}')
+        else:
+            self.logger.debug(f'stdout: {out.decode()}')
+        return ec, out, err
+
+    def clone(self, url: str, dest: str, cwd=None, options: Sequence[str] = (), redact=None):
+        return self.run(['clone', *options, url, dest], cwd=cwd, redact=redact)
+
+    def checkout(self, cwd: str, refspec: str):
+        return self.run(['checkout', refspec], cwd=cwd)
+
+    def add(self, cwd: str, paths: List[str], force=False):
+        if not paths:
+            return 0, b'', b''
+        return self.run(['add', *(['-f'] if force else []), '--', *paths], cwd=cwd)
+
+    def rm(self, cwd: str, paths: List[str]):
+        if not paths:
+            return 0, b'', b''
+        return self.run(['rm', '--quiet', '--', *paths], cwd=cwd)
+
+    def commit(self, cwd: str, message: str, paths: Sequence[str] = ()):
+        return self.run(['commit', '--quiet', '-m', message, *(['--', *paths] if paths else [])], cwd=cwd)
+
+    def push(self, cwd: str):
+        return self.run(['push', '--quiet'], cwd=cwd)
+
+    def has_staged_changes(self, cwd: str) -> bool:
+        """True if the index differs from HEAD; raises if git itself fails."""
+        ec, out, err = self.run(['diff', '--cached', '--quiet'], cwd=cwd, ok_codes=(0, 1))
+        if ec not in (0, 1):
+            raise Exception(f'git diff --cached failed in {cwd}... see stdout/stderr above')
+        return ec == 1
+
+    def record(self, command: str, elapsed: float, failed=False):
+        with self.lock:
+            stats = self.stats.setdefault(command, {'count': 0, 'time': 0.0, 'max': 0.0, 'failures': 0})
+            stats['count'] += 1
+            stats['time'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['failures'] += int(failed)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {command: dict(stats) for command, stats in self.stats.items()}
+
+    def log_metrics(self, logger: Union[logging.Logger, None] = None):
+        logger = logger or self.logger
+        for command, stats in sorted(self.metrics().items(), key=lambda item: -item[1]['time']):
+            logger.info(f'git {command}: {stats["count"]} runs, {stats["time"]:.1f}s total, '
+                        f'{stats["time"] / max(stats["count"], 1) * 1000:.0f}ms avg, {stats["max"] * 1000:.0f}ms max, '
+                        f'{stats["failures"]} failures')
+
+
+# Runner shared by all the scripts of a run
+git_runner = GitRunner()
@@ -0,0 +1,220 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class GitHubClient:
+    """
+    Shared HTTP client for the GitHub REST and GraphQL APIs.
+
+    - one pooled requests.Session for all the calls of a run (keep-alive instead of a new
+      TLS connection per request), safe to use from the deployer worker threads
+    - conditional GETs: responses carrying an ETag are cached and revalidated with
+      If-None-Match; a 304 does not count against the rate limit
+    - backoff driven by the rate-limit headers: requests wait for X-RateLimit-Reset once
+      the remaining budget is exhausted, 403/429 secondary rate limits honour Retry-After
+      (or back off exponentially from one minute), 5xx and connection errors are retried
+    - per-endpoint request count, latency, retries and errors, see log_metrics()
+    - "observers" are called after every attempt with (endpoint, latency, status code or
+      None on connection errors, remaining rate-limit budget or None), e.g. Tracer.github_call
+
+    The get/post/put/patch/delete/request methods take the same arguments and return the
+    same requests.Response as the requests module functions they replace.
+    """
+
+    retry_statuses = (500, 502, 503, 504)
+
+    def __init__(self, max_retries=5, backoff=2.0, secondary_backoff=60.0, max_wait=900.0,
+                 pool_size=32, etag_cache_size=2048, logger: Union[logging.Logger, None] = None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.secondary_backoff = secondary_backoff
+        self.max_wait = max_wait
+        self.logger = logger or logging.getLogger(__name__)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.lock = threading.Lock()
+        self.etag_cache_size = etag_cache_size
+        self.etag_cache: OrderedDict = OrderedDict()
+        # X-RateLimit-Resource (core, graphql, search...) -> (remaining, reset epoch)
+        self.rate_limits: Dict[str, tuple] = {}
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self.observers: List[Callable] = []
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url, **kwargs) -> requests.Response:
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        method = method.upper()
+        endpoint = self.endpoint(method, url)
+        headers = dict(kwargs.pop('headers', None) or {})
+        cache_key = None
+        if method == 'GET':
+            cache_key = (url, repr(sorted((kwargs.get('params') or {}).items())), headers.get('Authorization'))
+            with self.lock:
+                cached = self.etag_cache.get(cache_key)
+            if cached is not None:
+                headers['If-None-Match'] = cached.headers['ETag']
+
+        attempt = 0
+        while True:
+            self.wait_for_rate_limit(url)
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                latency = time.monotonic() - start
+                self.record(endpoint, latency, error=True)
+                self.notify(endpoint, latency, None, None)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                self.logger.warning(f'{method} {url} failed ({e!r}), retrying in {delay:.0f}s')
+            else:
+                latency = time.monotonic() - start
+                self.record(endpoint, latency, error=response.status_code >= 400)
+                remaining = response.headers.get('X-RateLimit-Remaining')
+                self.notify(endpoint, latency, response.status_code,
+                            int(remaining) if remaining is not None else None)
+                self.update_rate_limit(response)
+                delay = self.retry_delay(response, attempt)
+                if delay is None:
+                    break
+                self.logger.warning(f'{method} {url} returned {response.status_code}, retrying in {delay:.0f}s')
+            attempt += 1
+            self.record(endpoint, retry=True)
+            time.sleep(delay)
+
+        if cache_key is None:
+            return response
+        if response.status_code == 304:
+            self.record(endpoint, not_modified=True)
+            return cached
+        if response.ok and 'ETag' in response.headers:
+            with self.lock:
+                self.etag_cache[cache_key] = response
+                self.etag_cache.move_to_end(cache_key)
+                if len(self.etag_cache) > self.etag_cache_size:
+                    self.etag_cache.popitem(last=False)
+        return response
+
+    def retry_delay(self, response: requests.Response, attempt: int) -> Union[float, None]:
+        """Seconds to wait before retrying "response", or None if it is final."""
+        if attempt >= self.max_retries:
+            return None
+        status = response.status_code
+        if status in self.retry_statuses:
+            return self.backoff * 2 ** attempt
+        if status in (403, 429):
+            if 'Retry-After' in response.headers:
+                return min(float(response.headers['Retry-After']), self.max_wait)
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                return self.reset_delay(response.headers.get('X-RateLimit-Reset'))
+            if status == 429 or 'secondary rate limit' in response.text.lower():
+                return min(self.secondary_backoff * 2 ** attempt, self.max_wait)
+            return None
+        if status == 200 and response.url.endswith('/graphql'):
+            # GraphQL reports an exhausted budget as a 200 with a RATE_LIMITED error
+            try:
+                errors = response.json().get('errors') or []
+            except ValueError:
+                return None
+            if any(error.get('type') == 'RATE_LIMITED' for error in errors):
+                return self.reset_delay(response.headers.get('X-RateLimit-Reset'), attempt)
+        return None
+
+    def reset_delay(self, reset, attempt=0) -> float:
+        if not reset:
+            return min(self.secondary_backoff * 2 ** attempt, self.max_wait)
+        return min(max(float(reset) - time.time(), 0) + 1, self.max_wait)
+
+    def update_rate_limit(self, response: requests.Response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        resource = response.headers.get('X-RateLimit-Resource', 'core')
+        with self.lock:
+            self.rate_limits[resource] = (int(remaining), float(reset))
+
+    def wait_for_rate_limit(self, url: str):
+        """Blocks until the reset time when the budget of the resource of "url" is spent."""
+        resource = 'graphql' if url.endswith('/graphql') else 'core'
+        with self.lock:
+            remaining, reset = self.rate_limits.get(resource, (1, 0))
+        if remaining > 0:
+            return
+        delay = min(reset - time.time() + 1, self.max_wait)
+        if delay > 0:
+            self.logger.warning(f'GitHub {resource} rate limit exhausted, waiting {delay:.0f}s for the reset')
+            time.sleep(delay)
+        with self.lock:
+            # let the next response refresh the budget
+            self.rate_limits.pop(resource, None)
+
+    @staticmethod
+    def endpoint(method: str, url: str) -> str:
+        """"GET /repos/:owner/:repo/branches/:branch/protection" style metrics key."""
+        path = re.sub(r'^https?://[^/]+', '', url).split('?')[0]
+        path = re.sub(r'^/repos/[^/]+/[^/]+', '/repos/:owner/:repo', path)
+        path = re.sub(r'^/orgs/[^/]+', '/orgs/:org', path)
+        path = re.sub(r'/branches/[^/]+', '/branches/:branch', path)
+        path = re.sub(r'/(secrets|variables|blobs|trees|commits|refs/heads)/[^/]+', r'/\1/:name', path)
+        path = re.sub(r'/\d+(?=/|$)', '/:id', path)
+        return f'{method} {path}'
+
+    def record(self, endpoint: str, latency=0.0, error=False, retry=False, not_modified=False):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {'count': 0, 'time': 0.0, 'max': 0.0,
+                                                     'errors': 0, 'retries': 0, 'not_modified': 0})
+            if retry:
+                stats['retries'] += 1
+            elif not_modified:
+                stats['not_modified'] += 1
+            else:
+                stats['count'] += 1
+                stats['time'] += latency
+                stats['max'] = max(stats['max'], latency)
+                stats['errors'] += int(error)
+
+    def notify(self, endpoint: str, latency: float, status: Union[int, None], remaining: Union[int, None]):
+        for observer in self.observers:
+            observer(endpoint, latency, status, remaining)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {endpoint: dict(stats) for endpoint, stats in self.stats.items()}
+
+    def log_metrics(self, logger: Union[logging.Logger, None] = None):
+        logger = logger or self.logger
+        for endpoint, stats in sorted(self.metrics().items(), key=lambda item: -item[1]['time']):
+            logger.info(f'{endpoint}: {stats["count"]} requests, {stats["time"]:.1f}s total, '
+                        f'{stats["time"] / max(stats["count"], 1) * 1000:.0f}ms avg, {stats["max"] * 1000:.0f}ms max, '
+                        f'{stats["errors"]} errors, {stats["retries"]} retries, {stats["not_modified"]} not modified')
+        with self.lock:
+            for resource, (remaining, reset) in sorted(self.rate_limits.items()):
+                logger.info(f'rate limit {resource}: {remaining} remaining, resets at {time.ctime(reset)}')
+
+
+# Client shared by all the scripts of a run
+github_http = GitHubClient()
@@ -0,0 +1,23 @@
+import fcntl
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def publish_lock(path=None):
+    """
+    Serializes the publish step of the deployer modules: the update of
+    workflows-deployed.yaml and the devx-sonarqube commit, both shared by every module
+    of a run.  main.py --jobs runs modules in parallel worker processes, so this is an
+    flock() on DEPLOYER_PUBLISH_LOCK (.deployer-publish.lock in the working directory by
+    default); it is released by the kernel if the process dies.
+    """
+    path = path or os.environ.get('DEPLOYER_PUBLISH_LOCK', '.deployer-publish.lock')
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as lock_f:
+        fcntl.flock(lock_f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,227 @@
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Union
+
+from utils.github_client import github_http
+
+
+def iter_org_repositories(organisation: str, headers: Dict[str, str], sort='full_name',
+                          direction='asc') -> Iterator[Dict]:
+    """Yields the repositories of the organisation as /orgs/{org}/repos returns them, page by page."""
+    url = f'https://api.github.com/orgs/{organisation}/repos'
+    params = {'type': 'all', 'per_page': 100, 'sort': sort, 'direction': direction}
+    while url:
+        response = github_http.get(url, headers=headers, params=params)
+        response.raise_for_status()
+        yield from response.json()
+        # the "next" link already carries the query string
+        url, params = response.links.get('next', {}).get('url'), None
+
+
+class RepoMetadataCache:
+    """
+    On-disk cache of the repository metadata of an organisation: numeric id, GraphQL
+    node id, default branch, archived flag and the repository variables looked up
+    through variable() (e.g. the language variable).
+
+    The whole organisation is loaded with one paginated scan of /orgs/{org}/repos and
+    kept in REPO_CACHE_DIR.  After REPO_CACHE_TTL seconds (one hour by default) only the
+    repositories updated since the last scan are fetched again (refresh()); a full scan,
+    which also drops deleted and renamed repositories, is done every
+    REPO_CACHE_FULL_TTL seconds (one week by default).  A repository missing from the
+    cache triggers at most one rescan per run; callers that get a 404 for a cached
+    repository drop it with invalidate().  Variable values are kept for
+    REPO_CACHE_VARIABLE_TTL seconds (REPO_CACHE_TTL by default); a variable that is not
+    set is only remembered for the rest of the run.  Variable lookups and
+    invalidations are written back when the process exits.
+    """
+
+    def __init__(self, organisation: str, headers: Dict[str, str], path=None, ttl=None):
+        self.organisation = organisation
+        self.headers = headers
+        cache_dir = os.environ.get('REPO_CACHE_DIR', os.path.expanduser('~/.cache/workflow-deployer'))
+        self.path = path or f'{cache_dir}/{organisation}-repositories.json'
+        self.ttl = ttl if ttl is not None else int(os.environ.get('REPO_CACHE_TTL', '3600'))
+        self.full_ttl = int(os.environ.get('REPO_CACHE_FULL_TTL', '604800'))
+        self.variable_ttl = int(os.environ.get('REPO_CACHE_VARIABLE_TTL', str(self.ttl)))
+        # (repo, variable) found not set by this process, never persisted
+        self.missing = set()
+        self.lock = threading.RLock()
+        self.data: Union[Dict, None] = None
+        self.rescanned = False
+        self.dirty = False
+        atexit.register(self.flush)
+
+    def load(self) -> Dict:
+        with self.lock:
+            if self.data is None and os.path.isfile(self.path):
+                self.load_file()
+            if self.data is None or 'cursor' not in self.data or time.time() - self.data['scanned'] > self.full_ttl:
+                self.scan()
+            elif time.time() - self.data['refreshed'] > self.ttl:
+                self.refresh()
+            return self.data
+
+    def is_fresh(self) -> bool:
+        with self.lock:
+            if self.data is None:
+                try:
+                    self.load_file()
+                except OSError:
+                    return False
+            return (self.data is not None and 'cursor' in self.data and time.time() - self.data['scanned'] <= self.full_ttl
+                    and time.time() - self.data['refreshed'] <= self.ttl)
+
+    def load_file(self):
+        with open(self.path) as cache_f:
+            try:
+                self.data = json.load(cache_f)
+            except ValueError:
+                self.data = None
+
+    def entry(self, repo: Dict) -> Dict:
+        old = ((self.data or {}).get('repositories') or {}).get(repo['name'], {})
+        variables = old.get('variables', {}) if old.get('id') == repo['id'] else {}
+        return {
+            'id': repo['id'],
+            'node_id': repo['node_id'],
+            'default_branch': repo['default_branch'],
+            'archived': repo['archived'],
+            # {variable: {'value', 'fetched'}}, the expired ones are dropped
+            'variables': {name: variable for name, variable in variables.items() if self.variable_fresh(variable)}
+        }
+
+    def variable_fresh(self, variable) -> bool:
+        # entries of older cache files are bare values (or None for a 404) without a fetch time
+        return isinstance(variable, dict) and time.time() - variable.get('fetched', 0) <= self.variable_ttl
+
+    def stream(self) -> Iterator[tuple]:
+        """
+        Yields (name, metadata) for every repository of the organisation.  A cache past
+        REPO_CACHE_TTL but not REPO_CACHE_FULL_TTL is brought up to date with refresh()
+        first.  Otherwise, when the cache is not fresh, they are yielded as the pages of
+        a full scan arrive, so the caller can start working on the first repositories
+        right away; the cache is updated once the scan completes.
+        """
+        if not self.is_fresh():
+            with self.lock:
+                if self.data is not None and 'cursor' in self.data \
+                        and time.time() - self.data['scanned'] <= self.full_ttl:
+                    self.refresh()
+        if self.is_fresh():
+            yield from list(self.data['repositories'].items())
+            return
+        started = time.time()
+        repositories = {}
+        cursor = ''
+        for repo in iter_org_repositories(self.organisation, self.headers):
+            with self.lock:
+                repositories[repo['name']] = self.entry(repo)
+            cursor = max(cursor, repo['updated_at'])
+            yield repo['name'], repositories[repo['name']]
+        with self.lock:
+            self.data = {'scanned': started, 'refreshed': started, 'cursor': cursor, 'repositories': repositories}
+            self.rescanned = True
+            self.save()
+
+    def scan(self):
+        """Reloads every repository of the organisation, keeping the cached variables."""
+        with self.lock:
+            self.data = {'scanned': 0, 'refreshed': 0, 'repositories': (self.data or {}).get('repositories', {})}
+            for _ in self.stream():
+                pass
+
+    def refresh(self):
+        """Fetches only the repositories updated since the last scan or refresh."""
+        with self.lock:
+            started = time.time()
+            cursor = self.data['cursor']
+            updated = 0
+            for repo in iter_org_repositories(self.organisation, self.headers, sort='updated', direction='desc'):
+                if repo['updated_at'] < self.data['cursor']:
+                    break
+                self.data['repositories'][repo['name']] = self.entry(repo)
+                cursor = max(cursor, repo['updated_at'])
+                updated += 1
+            self.data.update({'refreshed': started, 'cursor': cursor})
+            self.save()
+            return updated
+
+    def flush(self):
+        if self.dirty:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            self.dirty = False
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as cache_f:
+                json.dump(self.data, cache_f)
+            os.replace(tmp_path, self.path)
+
+    def names(self) -> List[str]:
+        return list(self.load()['repositories'])
+
+    def __contains__(self, repo_name: str) -> bool:
+        return self.get(repo_name) is not None
+
+    def ids(self) -> Dict[str, int]:
+        return {name: repo['id'] for name, repo in self.load()['repositories'].items()}
+
+    def get(self, repo_name: str) -> Union[Dict, None]:
+        with self.lock:
+            repositories = self.load()['repositories']
+            if repo_name not in repositories and not self.rescanned:
+                # created since the last scan?
+                self.scan()
+                repositories = self.data['repositories']
+            return repositories.get(repo_name)
+
+    def invalidate(self, repo_name: str):
+        with self.lock:
+            if self.data and self.data['repositories'].pop(repo_name, None) is not None:
+                self.rescanned = False
+                self.dirty = True
+
+    def variable(self, repo_name: str, variable: str) -> Union[str, None]:
+        """Returns the value of a repository variable, None if it is not set."""
+        repo = self.get(repo_name)
+        if repo is None:
+            return None
+        with self.lock:
+            cached = repo['variables'].get(variable)
+            if self.variable_fresh(cached):
+                return cached['value']
+            if (repo_name, variable) in self.missing:
+                return None
+        response = github_http.get(f'https://api.github.com/repos/{self.organisation}/{repo_name}/actions/variables/{variable}',
+                                   headers=self.headers)
+        if response.status_code == 404:
+            with self.lock:
+                self.missing.add((repo_name, variable))
+                if variable in repo['variables']:
+                    del repo['variables'][variable]
+                    self.dirty = True
+            return None
+        response.raise_for_status()
+        value = response.json()['value']
+        with self.lock:
+            repo['variables'][variable] = {'value': value, 'fetched': time.time()}
+            self.dirty = True
+        return value
+
+
+# organisation -> cache shared by all the callers of a run
+repo_caches: Dict[str, RepoMetadataCache] = {}
+repo_caches_lock = threading.Lock()
+
+
+def repo_metadata_cache(organisation: str, headers: Dict[str, str]) -> RepoMetadataCache:
+    with repo_caches_lock:
+        if organisation not in repo_caches:
+            repo_caches[organisation] = RepoMetadataCache(organisation, headers)
+        return repo_caches[organisation]
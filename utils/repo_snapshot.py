@@ -0,0 +1,70 @@
+from typing import Dict, List
+
+from utils.github_client import github_http
+from utils.repo_cache import repo_metadata_cache
+
+graphql_url = 'https://api.github.com/graphql'
+
+rules_selection = '''branchProtectionRules(first: 100%s) {
+        pageInfo { hasNextPage endCursor }
+        nodes { id pattern requiredStatusCheckContexts }
+    }'''
+
+
+def fetch_repository_snapshots(organisation: str, repositories: List[str], headers: Dict[str, str],
+                               batch_size=50) -> Dict[str, Dict]:
+    """
+    Returns {repo: {'id', 'default_branch', 'branch_protection_rules'}} with everything the
+    branch protection flow needs, fetched with one aliased GraphQL query per "batch_size"
+    repositories instead of three queries per repository.  Repositories with more than
+    100 protection rules get the remaining pages from fetch_branch_protection_rules().
+    Repositories that don't exist (or have no default branch) are left out.
+    """
+    snapshots = {}
+    for start in range(0, len(repositories), batch_size):
+        batch = repositories[start:start + batch_size]
+        aliases = '\n'.join(
+            f'''r{i}: repository(owner: "{organisation}", name: "{name}") {{
+                id
+                defaultBranchRef {{ name }}
+                {rules_selection % ''}
+            }}''' for i, name in enumerate(batch))
+        response = github_http.post(graphql_url, json={'query': f'query {{ {aliases} }}'}, headers=headers)
+        response.raise_for_status()
+        # unknown repositories come back as null aliases next to a NOT_FOUND error
+        data = response.json().get('data') or {}
+        for i, name in enumerate(batch):
+            repo = data.get(f'r{i}')
+            if not repo or not repo.get('defaultBranchRef'):
+                continue
+            rules = repo['branchProtectionRules']
+            nodes = rules['nodes']
+            if rules['pageInfo']['hasNextPage']:
+                nodes += fetch_branch_protection_rules(organisation, name, headers, after=rules['pageInfo']['endCursor'])
+            snapshots[name] = {'id': repo['id'],
+                               'default_branch': repo['defaultBranchRef']['name'],
+                               'branch_protection_rules': nodes}
+    return snapshots
+
+
+def fetch_branch_protection_rules(organisation: str, repository: str, headers: Dict[str, str],
+                                  after=None) -> List[Dict]:
+    """Returns all the branch protection rules of a repository, following the pagination."""
+    nodes = []
+    while True:
+        cursor = f', after: "{after}"' if after else ''
+        query = f'''query {{ repository(owner: "{organisation}", name: "{repository}") {{
+            {rules_selection % cursor}
+        }} }}'''
+        response = github_http.post(graphql_url, json={'query': query}, headers=headers)
+        response.raise_for_status()
+        repo = (response.json().get('data') or {}).get('repository')
+        if repo is None:
+            # deleted or renamed since it was cached
+            repo_metadata_cache(organisation, headers).invalidate(repository)
+            raise ValueError(f"The repository '{repository}' does not exist.")
+        rules = repo['branchProtectionRules']
+        nodes += rules['nodes']
+        if not rules['pageInfo']['hasNextPage']:
+            return nodes
+        after = rules['pageInfo']['endCursor']
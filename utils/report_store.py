@@ -0,0 +1,112 @@
+import json
+import os
+from typing import Dict
+
+import yaml
+
+# libyaml is an order of magnitude faster on large reports when PyYAML was built with it
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class ReportStore:
+    """
+    workflows-deployed.yaml ({'repositories': {repo: {'refspec', 'workflows': [{'name', 'updated'}]}}})
+    indexed by repository and workflow name, so that merging the deployments of a run
+    costs one dict lookup per workflow instead of a scan of the repository's list.
+
+    Every update is appended to a JSON lines log next to the report (one line per
+    repository) as it is applied; save() regenerates the YAML only when the content
+    changed and then drops the log.  A log left behind by a run that did not get to
+    save() is replayed by the next load.
+    """
+
+    def __init__(self, report_filename: str, log_filename=None):
+        self.report_filename = report_filename
+        self.log_filename = log_filename or f'{os.path.splitext(report_filename)[0]}.log.jsonl'
+        self.repositories: Dict[str, Dict] = {}
+        # repo -> workflow name -> entry of repositories[repo]['workflows']
+        self.index: Dict[str, Dict[str, Dict]] = {}
+        self.exists = False
+        self.changed = False
+        self.log_f = None
+        self.load()
+
+    def load(self):
+        if os.path.isfile(self.report_filename):
+            self.exists = True
+            with open(self.report_filename, 'r') as report_f:
+                report = yaml.load(report_f, Loader=YamlLoader)
+            for repo, deploy in ((report or {}).get('repositories') or {}).items():
+                self.add_repository(repo, deploy)
+        if os.path.isfile(self.log_filename):
+            self.exists = True
+            with open(self.log_filename, 'r') as log_f:
+                for line in log_f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # torn last line of an interrupted run
+                        break
+                    self.apply(record['kind'], record['repo'], record['deploy'])
+
+    def add_repository(self, repo: str, deploy: Dict):
+        entry = dict(deploy or {})
+        entry['workflows'] = [dict(wf) for wf in entry.get('workflows') or []]
+        self.repositories[repo] = entry
+        self.index[repo] = {}
+        for wf in entry['workflows']:
+            self.index[repo].setdefault(wf.get('name'), wf)
+
+    def apply(self, kind: str, repo: str, deploy: Dict):
+        """
+        Merges the workflows found in ("old") or deployed to ("new") a repository: a
+        repository new to the report is added as is; otherwise missing workflows are
+        appended and, for "new", the "updated" time of the existing ones is refreshed.
+        """
+        if repo not in self.repositories:
+            self.add_repository(repo, deploy)
+            self.changed = True
+            return
+        workflows = self.index[repo]
+        for wf in deploy.get('workflows', []):
+            existing = workflows.get(wf.get('name'))
+            if existing is None:
+                entry = dict(wf)
+                self.repositories[repo]['workflows'].append(entry)
+                workflows[wf.get('name')] = entry
+                self.changed = True
+            elif kind == 'new' and ('updated' not in existing or existing['updated'] != wf.get('updated')):
+                existing['updated'] = wf.get('updated')
+                self.changed = True
+
+    def record(self, kind: str, repo: str, deploy: Dict):
+        """Applies the update of one repository and appends it to the log."""
+        self.apply(kind, repo, deploy)
+        if self.log_f is None:
+            if os.path.dirname(self.log_filename):
+                os.makedirs(os.path.dirname(self.log_filename), exist_ok=True)
+            self.log_f = open(self.log_filename, 'a')
+        self.log_f.write(json.dumps({'kind': kind, 'repo': repo, 'deploy': deploy}) + '\n')
+        self.log_f.flush()
+
+    def update(self, new_deploys: Dict[str, Dict], old_deploys: Dict[str, Dict]):
+        # the workflows found in the repositories are only merged into an existing report
+        if self.exists:
+            for repo, deploy in old_deploys.items():
+                self.record('old', repo, deploy)
+        for repo, deploy in new_deploys.items():
+            self.record('new', repo, deploy)
+
+    def save(self):
+        """Writes the YAML report if it changed (or does not exist yet) and drops the log."""
+        if self.log_f is not None:
+            self.log_f.close()
+            self.log_f = None
+        if self.changed or not os.path.isfile(self.report_filename):
+            tmp_path = f'{self.report_filename}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as report_f:
+                report_f.write(yaml.dump({'repositories': self.repositories}, default_flow_style=False, sort_keys=False))
+            os.replace(tmp_path, self.report_filename)
+            self.changed = False
+        if os.path.isfile(self.log_filename):
+            os.remove(self.log_filename)
@@ -0,0 +1,60 @@
+from typing import Callable, Dict, Iterable, Set
+
+import requests
+
+from utils.github_client import github_http
+from utils.repo_cache import repo_metadata_cache
+
+
+def secret_repository_ids(organisation: str, secret: str, headers: Dict[str, str]) -> Set[int]:
+    """Returns the ids of the repositories currently selected for an organisation secret."""
+    selected = set()
+    url = f'https://api.github.com/orgs/{organisation}/actions/secrets/{secret}/repositories'
+    page = 1
+    while True:
+        response = github_http.get(url, headers=headers, params={'per_page': 100, 'page': page})
+        response.raise_for_status()
+        data = response.json()
+        selected.update(repo['id'] for repo in data['repositories'])
+        if page * 100 >= data['total_count']:
+            return selected
+        page += 1
+
+
+def reconcile_secret_access(organisation: str, secret_repositories: Dict[str, Iterable[str]],
+                            headers: Dict[str, str], log: Callable = print) -> Dict[str, bool]:
+    """
+    Gives every repository of secret_repositories[secret] access to the organisation
+    secret, keeping the repositories that already have it.  The repository ids come
+    from the repository metadata cache, rescanned once for a repository created since
+    the last scan, and each secret gets a single PUT, only if its selection actually
+    changes.  A secret that fails is logged and skipped.  Returns
+    {secret: updated}.
+    """
+    cache = repo_metadata_cache(organisation, headers)
+    repository_ids = cache.ids()
+    updated = {}
+    for secret, repositories in secret_repositories.items():
+        wanted = set()
+        for repo in repositories:
+            if repo not in repository_ids and cache.get(repo) is not None:
+                repository_ids = cache.ids()
+            if repo in repository_ids:
+                wanted.add(repository_ids[repo])
+            else:
+                log(f'Repository {repo} not found in {organisation}, not giving it access to the {secret} secret')
+        updated[secret] = False
+        try:
+            selected = secret_repository_ids(organisation, secret, headers)
+            if wanted <= selected:
+                log(f'Access to the {secret} secret is up to date')
+                continue
+            url = f'https://api.github.com/orgs/{organisation}/actions/secrets/{secret}/repositories'
+            response = github_http.put(url, headers=headers, json={'selected_repository_ids': sorted(selected | wanted)})
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            log(f'Failed to update the access to the {secret} secret: {str(e)}')
+            continue
+        log(f'Updated access to the {secret} secret for {len(wanted - selected)} repositories')
+        updated[secret] = True
+    return updated
@@ -0,0 +1,37 @@
+from typing import Dict, List
+
+default_qualitygate = 'glcp-sonarqube'
+
+
+class SonarQubeProjects:
+    """
+    Name index of the "Projects" list of a SonarQube config (sonar.yaml) loaded with
+    ruamel.  The index is built once, so onboarding N repositories into a config of P
+    projects is O(N + P) instead of one scan of the list per repository.  The new
+    projects are appended to the round-trip list in one batch, comments and layout of
+    the existing entries are left alone.
+    """
+
+    def __init__(self, data):
+        self.projects = data['Projects']
+        self.index: Dict[str, Dict] = {}
+        for project in self.projects:
+            self.index.setdefault(project['name'], project)
+
+    def __contains__(self, repo_name: str) -> bool:
+        return repo_name in self.index
+
+    def __len__(self) -> int:
+        return len(self.projects)
+
+    def add(self, repositories: Dict[str, str], qualitygate=default_qualitygate) -> List[str]:
+        """Adds the repositories ({name: default branch}) missing from the config; returns their names."""
+        new_projects = []
+        for repo_name, default_branch in repositories.items():
+            if repo_name in self.index:
+                continue
+            project = {'name': repo_name, 'branch': default_branch, 'qualitygate': qualitygate}
+            self.index[repo_name] = project
+            new_projects.append(project)
+        self.projects.extend(new_projects)
+        return [project['name'] for project in new_projects]
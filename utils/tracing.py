@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Union
+
+
+class Tracer:
+    """
+    Span instrumentation of a deployer run.
+
+    - span(name) times a phase (clone, manifest, detect_drift, push...) of the current
+      thread; repository(name) opens the span of a repository and attributes everything
+      the thread does until it is closed (phases and GitHub calls) to that repository
+    - github_call() is registered as a GitHubClient observer and records every HTTP
+      attempt with its endpoint, latency, status code and remaining rate-limit budget
+      under the innermost open span
+    - write() dumps the run as a Chrome trace event file (chrome://tracing, Perfetto),
+      one row per worker thread; log_summary() logs per phase, per endpoint and slowest
+      repositories tables
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start = time.time()
+        self.events: List[Dict] = []
+
+    def stack(self) -> List[Dict]:
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def current_repo(self) -> Union[str, None]:
+        return getattr(self.local, 'repo', None)
+
+    @contextmanager
+    def span(self, name: str, category='phase', **attrs):
+        span = {'name': name, 'cat': category, 'repo': self.current_repo(), 'args': attrs,
+                'api_calls': 0, 'api_time': 0.0}
+        stack = self.stack()
+        stack.append(span)
+        start = time.time()
+        try:
+            yield span
+        except BaseException as e:
+            span['args']['error'] = repr(e)
+            raise
+        finally:
+            stack.pop()
+            self.add(span, start, time.time() - start)
+
+    @contextmanager
+    def repository(self, repo_name: str):
+        previous = self.current_repo()
+        self.local.repo = repo_name
+        try:
+            with self.span(repo_name, category='repository') as span:
+                yield span
+        finally:
+            self.local.repo = previous
+
+    def github_call(self, endpoint: str, latency: float, status: Union[int, None], remaining: Union[int, None]):
+        """GitHubClient observer: one call per HTTP attempt, status None on connection errors"""
+        for span in self.stack():
+            span['api_calls'] += 1
+            span['api_time'] += latency
+        phase = self.stack()[-1]['name'] if self.stack() else None
+        self.add({'name': endpoint, 'cat': 'github', 'repo': self.current_repo(), 'phase': phase,
+                  'args': {'status': status, 'rate_limit_remaining': remaining}},
+                 time.time() - latency, latency)
+
+    def add(self, event: Dict, start: float, duration: float):
+        event.update({'ts': start - self.start, 'dur': duration, 'tid': threading.current_thread().name})
+        with self.lock:
+            self.events.append(event)
+
+    def write(self, path: str):
+        with self.lock:
+            events = list(self.events)
+        trace = []
+        for event in events:
+            args = dict(event['args'], repo=event['repo'])
+            if event['cat'] == 'github':
+                args['phase'] = event['phase']
+            else:
+                args.update(api_calls=event['api_calls'], api_time=round(event['api_time'], 3))
+            trace.append({'name': event['name'], 'cat': event['cat'], 'ph': 'X', 'pid': os.getpid(),
+                          'tid': event['tid'], 'ts': round(event['ts'] * 1e6), 'dur': round(event['dur'] * 1e6),
+                          'args': args})
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as trace_f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, trace_f)
+        os.replace(tmp_path, path)
+
+    def summary(self, top=10) -> Dict:
+        """Per phase and per endpoint totals, and the "top" slowest repositories."""
+        with self.lock:
+            events = list(self.events)
+        phases: Dict[str, Dict] = {}
+        endpoints: Dict[str, Dict] = {}
+        repositories = []
+        for event in events:
+            if event['cat'] == 'repository':
+                repositories.append((event['dur'], event['name'], event['api_calls']))
+            elif event['cat'] == 'phase':
+                stats = phases.setdefault(event['name'], {'count': 0, 'time': 0.0, 'max': 0.0, 'api_calls': 0})
+                stats['count'] += 1
+                stats['time'] += event['dur']
+                stats['max'] = max(stats['max'], event['dur'])
+                stats['api_calls'] += event['api_calls']
+            else:
+                stats = endpoints.setdefault(event['name'], {'count': 0, 'time': 0.0, 'statuses': {},
+                                                             'min_remaining': None})
+                stats['count'] += 1
+                stats['time'] += event['dur']
+                status = str(event['args']['status'])
+                stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+                remaining = event['args']['rate_limit_remaining']
+                if remaining is not None and (stats['min_remaining'] is None or remaining < stats['min_remaining']):
+                    stats['min_remaining'] = remaining
+        return {'phases': phases, 'endpoints': endpoints,
+                'repositories': sorted(repositories, reverse=True)[:top]}
+
+    def log_summary(self, logger: logging.Logger, top=10):
+        summary = self.summary(top)
+        logger.info(f'{"phase":32} {"count":>6} {"total s":>9} {"avg ms":>8} {"max ms":>8} {"api calls":>9}')
+        for name, stats in sorted(summary['phases'].items(), key=lambda item: -item[1]['time']):
+            logger.info(f'{name:32} {stats["count"]:>6} {stats["time"]:>9.1f} '
+                        f'{stats["time"] / stats["count"] * 1000:>8.0f} {stats["max"] * 1000:>8.0f} {stats["api_calls"]:>9}')
+        logger.info(f'{"endpoint":60} {"calls":>6} {"total s":>9} {"min remaining":>13} statuses')
+        for name, stats in sorted(summary['endpoints'].items(), key=lambda item: -item[1]['time']):
+            statuses = ' '.join(f'{status}:{count}' for status, count in sorted(stats['statuses'].items()))
+            remaining = '-' if stats['min_remaining'] is None else stats['min_remaining']
+            logger.info(f'{name:60} {stats["count"]:>6} {stats["time"]:>9.1f} {remaining:>13} {statuses}')
+        logger.info(f'{"slowest repositories":60} {"seconds":>8} {"api calls":>9}')
+        for duration, name, api_calls in summary['repositories']:
+            logger.info(f'{name:60} {duration:>8.1f} {api_calls:>9}')
+
+
+# Tracer shared by all the scripts of a run
+tracer = Tracer()
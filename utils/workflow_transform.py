@@ -0,0 +1,94 @@
+import os
+import re
+import threading
+from typing import Dict
+from urllib.parse import quote
+
+import yaml
+
+# the line the former sed "/branches:/a \ \ \ \ \ \ - <branch>" appended after every "branches:" line
+branch_line = '      - {}\n'
+cron_pattern = re.compile(r'cron:.*')
+
+
+def workflow_triggers(doc) -> Dict:
+    # YAML 1.2 (ruamel) keeps the "on" key a string, PyYAML turns it into True
+    triggers = doc.get('on', doc.get(True)) if isinstance(doc, dict) else None
+    return triggers if isinstance(triggers, dict) else {}
+
+
+def default_branch_missing(doc, default_branch: str) -> bool:
+    """True if the default branch is missing from the "push" branches of the workflow"""
+    push = workflow_triggers(doc).get('push')
+    return isinstance(push, dict) and isinstance(push.get('branches'), list) and default_branch not in push['branches']
+
+
+def add_default_branch(text: str, default_branch: str) -> str:
+    """
+    Inserts "      - <default branch>" right after every line containing "branches:",
+    byte for byte what the former sed "/branches:/a" edit produced.
+    """
+    lines = text.splitlines(keepends=True)
+    edited = []
+    for line in lines:
+        edited.append(line)
+        if 'branches:' in line:
+            if not line.endswith('\n'):
+                edited[-1] = line + '\n'
+            edited.append(branch_line.format(default_branch))
+    return ''.join(edited)
+
+
+def clear_cron(text: str) -> str:
+    """Blanks the value of the "cron:" lines, like the former sed "s/cron:.*/cron:/"."""
+    return cron_pattern.sub('cron:', text)
+
+
+def transform_workflow(source: str, dest: str, default_branch=None, cron=False) -> bool:
+    """
+    Applies the default branch injection ("default_branch", only when the branch is
+    missing from the "push" branches) and/or the cron blanking ("cron") to the workflow
+    "source" in one pass and writes the result to "dest" (which may be "source"
+    itself).  The edits are line level, every other line is kept as is.  Nothing is
+    written when no edit applies.  Returns True if "dest" was written.
+    """
+    with open(source, 'r') as fh:
+        text = fh.read()
+    edited = text
+    if default_branch and default_branch_missing(yaml.safe_load(text), default_branch):
+        edited = add_default_branch(edited, default_branch)
+    if cron:
+        edited = clear_cron(edited)
+    if edited == text:
+        return False
+    tmp_path = f'{dest}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as fh:
+        fh.write(edited)
+    os.replace(tmp_path, dest)
+    return True
+
+
+class WorkflowRenderer:
+    """
+    Renders the managed workflows that need the default branch of the target repo
+    (custom_branch_workflows) once per (workflow, refspec, default branch) into
+    "out_dir", and shares the result between all the repositories of a run with the
+    same default branch.
+    """
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.lock = threading.Lock()
+        self.rendered: Dict[tuple, str] = {}
+
+    def render(self, source: str, refspec: str, default_branch: str) -> str:
+        """Returns the path of the workflow to deploy: "source" itself if it needs no change."""
+        key = (source, refspec, default_branch)
+        with self.lock:
+            if key not in self.rendered:
+                # refspec None is the default branch of managed-ci-workflow
+                dest_dir = f'{self.out_dir}/{quote(refspec or "HEAD", safe="")}/{quote(default_branch, safe="")}'
+                dest = f'{dest_dir}/{os.path.basename(source)}'
+                os.makedirs(dest_dir, exist_ok=True)
+                self.rendered[key] = dest if transform_workflow(source, dest, default_branch=default_branch) else source
+            return self.rendered[key]